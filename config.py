@@ -32,6 +32,13 @@ def _get_float_env(key: str, default: Optional[float] = None) -> float:
     return float(value)
 
 
+def _get_bool_env(key: str, default: bool) -> bool:
+    value = os.getenv(key)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
 def _get_admin_ids() -> Set[int]:
     raw = os.getenv("ADMIN_IDS", "")
     ids = set()
@@ -47,6 +54,15 @@ class Settings:
     bot_token: str
     bot_username: Optional[str]
     database_url: str
+    database_replica_url: Optional[str]
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: float
+    db_pool_recycle: int
+    db_pool_pre_ping: bool
+    db_statement_cache_size: int
+    db_pgbouncer: bool
+    db_migrate_on_startup: bool
     admin_ids: Set[int]
     support_url: str
     instruction_url: str
@@ -57,11 +73,81 @@ class Settings:
     animate_cost: int
     stars_provider_token: str
     fsm_storage: str
+    bot_mode: str
+    webhook_url: Optional[str]
+    webhook_path: str
+    webhook_secret: Optional[str]
+    webhook_host: str
+    webhook_port: int
+    webhook_workers: int
+    webhook_max_connections: int
+    webhook_shutdown_timeout: float
     redis_url: Optional[str]
     yoomoney_base_url: str
     gemini_api_key: str
     gemini_nano_model: str
     gemini_pro_model: str
+    gemini_backend: str
+    gemini_max_inflight: int
+    veo_poll_initial_delay: float
+    veo_poll_max_delay: float
+    veo_poll_backoff: float
+    veo_poll_batch_size: int
+    result_cache_backend: str
+    result_cache_max_entries: int
+    result_cache_ttl: int
+    user_cache_backend: str
+    user_cache_ttl: int
+    user_cache_max_entries: int
+    history_page_size: int
+    history_cache_ttl: int
+    history_cache_max_users: int
+    file_cache_max_bytes: int
+    file_path_cache_ttl: int
+    image_target_nano: int
+    image_target_pro: int
+    image_target_animate: int
+    image_prep_workers: int
+    image_jpeg_quality: int
+    result_spill_threshold: int
+    result_spill_dir: Optional[str]
+    progress_tick_seconds: float
+    progress_step_seconds: int
+    progress_edits_per_second: float
+    outbound_global_rate: float
+    outbound_chat_rate: float
+    outbound_chat_burst: float
+    outbound_max_retries: int
+    outbound_concurrency: int
+    referral_code_pool_size: int
+    referral_code_pool_refill_interval: float
+    action_log_queue_size: int
+    action_log_batch_size: int
+    action_log_flush_interval: float
+    action_log_overflow: str
+    action_log_partitions_ahead: int
+    log_export_chunk_size: int
+    log_export_part_bytes: int
+    action_log_retention_months: int
+    action_log_maintenance_interval: float
+    generation_workers: int
+    generation_queue_size: int
+    generation_nano_concurrency: int
+    generation_pro_concurrency: int
+    generation_animate_concurrency: int
+    generation_stale_after: float
+    metrics_log_interval: float
+
+    @property
+    def bot_processes(self) -> int:
+        """Processes handling updates at once: the webhook workers, or the single polling process."""
+        return self.webhook_workers if self.bot_mode == "webhook" else 1
+
+    def per_process(self, total):
+        """Share of a limit meant for the whole bot, so that the workers together stay within it."""
+        if isinstance(total, int):
+            return max(1, total // self.bot_processes)
+        return total / self.bot_processes
 
     @staticmethod
     def load() -> "Settings":
@@ -69,6 +155,15 @@ class Settings:
             bot_token=_get_env("BOT_TOKEN"),
             bot_username=os.getenv("BOT_USERNAME"),
             database_url=_get_env("DATABASE_URL"),
+            database_replica_url=os.getenv("DATABASE_REPLICA_URL") or None,
+            db_pool_size=_get_int_env("DB_POOL_SIZE", 10),
+            db_max_overflow=_get_int_env("DB_MAX_OVERFLOW", 10),
+            db_pool_timeout=_get_float_env("DB_POOL_TIMEOUT", 30.0),
+            db_pool_recycle=_get_int_env("DB_POOL_RECYCLE", 1800),
+            db_pool_pre_ping=_get_bool_env("DB_POOL_PRE_PING", True),
+            db_statement_cache_size=_get_int_env("DB_STATEMENT_CACHE_SIZE", 100),
+            db_pgbouncer=_get_bool_env("DB_PGBOUNCER", False),
+            db_migrate_on_startup=_get_bool_env("DB_MIGRATE_ON_STARTUP", True),
             admin_ids=_get_admin_ids(),
             support_url=_get_env("SUPPORT_URL", "https://t.me/support"),
             instruction_url=_get_env("INSTRUCTION_URL", "https://example.com/instruction"),
@@ -79,11 +174,70 @@ class Settings:
             animate_cost=_get_int_env("ANIMATE_COST", 10),
             stars_provider_token=os.getenv("STARS_PROVIDER_TOKEN", ""),
             fsm_storage=os.getenv("FSM_STORAGE", "memory"),
+            bot_mode=os.getenv("BOT_MODE", "polling"),
+            webhook_url=os.getenv("WEBHOOK_URL") or None,
+            webhook_path=os.getenv("WEBHOOK_PATH", "/telegram/webhook"),
+            webhook_secret=os.getenv("WEBHOOK_SECRET") or None,
+            webhook_host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            webhook_port=_get_int_env("WEBHOOK_PORT", 8080),
+            webhook_workers=_get_int_env("WEBHOOK_WORKERS", 1),
+            webhook_max_connections=_get_int_env("WEBHOOK_MAX_CONNECTIONS", 40),
+            webhook_shutdown_timeout=_get_float_env("WEBHOOK_SHUTDOWN_TIMEOUT", 30.0),
             redis_url=os.getenv("REDIS_URL"),
             yoomoney_base_url=_get_env("YOOMONEY_BASE_URL", "https://pay.nanobanana.mock"),
             gemini_api_key=_get_env("GEMINI_API_KEY"),
             gemini_nano_model=_get_env("GEMINI_NANO_MODEL", "models/gemini-2.5-flash-image"),
             gemini_pro_model=_get_env("GEMINI_PRO_MODEL", "models/gemini-2.5-flash-image"),
+            gemini_backend=os.getenv("GEMINI_BACKEND", "aio"),
+            gemini_max_inflight=_get_int_env("GEMINI_MAX_INFLIGHT", 1000),
+            veo_poll_initial_delay=_get_float_env("VEO_POLL_INITIAL_DELAY", 3.0),
+            veo_poll_max_delay=_get_float_env("VEO_POLL_MAX_DELAY", 20.0),
+            veo_poll_backoff=_get_float_env("VEO_POLL_BACKOFF", 1.5),
+            veo_poll_batch_size=_get_int_env("VEO_POLL_BATCH_SIZE", 20),
+            result_cache_backend=os.getenv("RESULT_CACHE_BACKEND", "memory"),
+            result_cache_max_entries=_get_int_env("RESULT_CACHE_MAX_ENTRIES", 10000),
+            result_cache_ttl=_get_int_env("RESULT_CACHE_TTL", 86400),
+            user_cache_backend=os.getenv("USER_CACHE_BACKEND", "auto"),
+            user_cache_ttl=_get_int_env("USER_CACHE_TTL", 30),
+            user_cache_max_entries=_get_int_env("USER_CACHE_MAX_ENTRIES", 50000),
+            history_page_size=_get_int_env("HISTORY_PAGE_SIZE", 8),
+            history_cache_ttl=_get_int_env("HISTORY_CACHE_TTL", 300),
+            history_cache_max_users=_get_int_env("HISTORY_CACHE_MAX_USERS", 10000),
+            file_cache_max_bytes=_get_int_env("FILE_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+            file_path_cache_ttl=_get_int_env("FILE_PATH_CACHE_TTL", 1800),
+            image_target_nano=_get_int_env("IMAGE_TARGET_NANO", 1024),
+            image_target_pro=_get_int_env("IMAGE_TARGET_PRO", 1536),
+            image_target_animate=_get_int_env("IMAGE_TARGET_ANIMATE", 1280),
+            image_prep_workers=_get_int_env("IMAGE_PREP_WORKERS", 2),
+            image_jpeg_quality=_get_int_env("IMAGE_JPEG_QUALITY", 90),
+            result_spill_threshold=_get_int_env("RESULT_SPILL_THRESHOLD", 4 * 1024 * 1024),
+            result_spill_dir=os.getenv("RESULT_SPILL_DIR") or None,
+            progress_tick_seconds=_get_float_env("PROGRESS_TICK_SECONDS", 1.0),
+            progress_step_seconds=_get_int_env("PROGRESS_STEP_SECONDS", 5),
+            progress_edits_per_second=_get_float_env("PROGRESS_EDITS_PER_SECOND", 20.0),
+            outbound_global_rate=_get_float_env("OUTBOUND_GLOBAL_RATE", 30.0),
+            outbound_chat_rate=_get_float_env("OUTBOUND_CHAT_RATE", 1.0),
+            outbound_chat_burst=_get_float_env("OUTBOUND_CHAT_BURST", 3.0),
+            outbound_max_retries=_get_int_env("OUTBOUND_MAX_RETRIES", 5),
+            outbound_concurrency=_get_int_env("OUTBOUND_CONCURRENCY", 30),
+            referral_code_pool_size=_get_int_env("REFERRAL_CODE_POOL_SIZE", 0),
+            referral_code_pool_refill_interval=_get_float_env("REFERRAL_CODE_POOL_REFILL_INTERVAL", 30.0),
+            action_log_queue_size=_get_int_env("ACTION_LOG_QUEUE_SIZE", 10000),
+            action_log_batch_size=_get_int_env("ACTION_LOG_BATCH_SIZE", 500),
+            action_log_flush_interval=_get_float_env("ACTION_LOG_FLUSH_INTERVAL", 1.0),
+            action_log_overflow=os.getenv("ACTION_LOG_OVERFLOW", "drop"),
+            action_log_partitions_ahead=_get_int_env("ACTION_LOG_PARTITIONS_AHEAD", 3),
+            log_export_chunk_size=_get_int_env("LOG_EXPORT_CHUNK_SIZE", 5000),
+            log_export_part_bytes=_get_int_env("LOG_EXPORT_PART_BYTES", 45 * 1000 * 1000),
+            action_log_retention_months=_get_int_env("ACTION_LOG_RETENTION_MONTHS", 6),
+            action_log_maintenance_interval=_get_float_env("ACTION_LOG_MAINTENANCE_INTERVAL", 6 * 3600),
+            generation_workers=_get_int_env("GENERATION_WORKERS", 16),
+            generation_queue_size=_get_int_env("GENERATION_QUEUE_SIZE", 500),
+            generation_nano_concurrency=_get_int_env("GENERATION_NANO_CONCURRENCY", 8),
+            generation_pro_concurrency=_get_int_env("GENERATION_PRO_CONCURRENCY", 4),
+            generation_animate_concurrency=_get_int_env("GENERATION_ANIMATE_CONCURRENCY", 4),
+            generation_stale_after=_get_float_env("GENERATION_STALE_AFTER", 3600.0),
+            metrics_log_interval=_get_float_env("METRICS_LOG_INTERVAL", 300.0),
         )
 
 
@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from config import settings
+
+
+class GenerationPageCache:
+    """Per-user cache of generation history pages.
+
+    Entries live ``ttl_seconds``; all pages of a user are dropped when one of
+    their generations completes. At most ``max_users`` users are kept (LRU).
+    """
+
+    def __init__(self, ttl_seconds: int, max_users: int) -> None:
+        self._ttl = ttl_seconds
+        self._max_users = max_users
+        self._users: "OrderedDict[int, Dict[Hashable, Tuple[float, object]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, key: Hashable) -> Optional[object]:
+        pages = self._users.get(user_id)
+        entry = pages.get(key) if pages else None
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user_id: int, key: Hashable, page: object) -> None:
+        if self._ttl <= 0:
+            return
+        pages = self._users.setdefault(user_id, {})
+        pages[key] = (time.monotonic() + self._ttl, page)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self._max_users:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._users.pop(user_id, None)
+
+
+# Pages are invalidated by the worker that finished the generation; other workers would keep serving
+# their stale copies, so the cache is only enabled in a single process.
+history_cache = GenerationPageCache(
+    settings.history_cache_ttl if settings.bot_processes == 1 else 0,
+    settings.history_cache_max_users,
+)
@@ -0,0 +1,140 @@
+"""Apply ``db/migrations/*.sql`` in order and record them in ``schema_migrations``.
+
+Usage: ``python -m db.migrate`` (apply pending) or ``python -m db.migrate --status``.
+
+A file whose first line is ``-- migrate: no-transaction`` runs statement by
+statement outside a transaction, which ``CREATE INDEX CONCURRENTLY`` needs.
+If such a migration fails halfway, drop any index left ``INVALID`` before
+rerunning: ``IF NOT EXISTS`` would otherwise keep the broken one.
+"""
+
+import argparse
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import asyncpg
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+# Arbitrary constant shared by every process that runs migrations.
+_LOCK_ID = 7_420_250_001
+_LOCK_RETRY_SECONDS = 1.0
+
+
+@dataclass
+class Migration:
+    version: str
+    path: Path
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self) -> List[str]:
+        without_comments = re.sub(r"--[^\n]*", "", self.sql)
+        return [statement.strip() for statement in without_comments.split(";") if statement.strip()]
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for path in sorted(directory.glob("*.sql")):
+        migrations.append(Migration(version=path.stem, path=path, sql=path.read_text(encoding="utf-8")))
+    return migrations
+
+
+def _dsn(database_url: str) -> str:
+    return re.sub(r"^postgresql\+asyncpg://", "postgresql://", database_url)
+
+
+async def _applied_versions(conn) -> set:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+    rows = await conn.fetch("SELECT version FROM schema_migrations")
+    return {row["version"] for row in rows}
+
+
+async def _apply(conn, migration: Migration) -> None:
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", migration.version)
+        return
+    for statement in migration.statements():
+        await conn.execute(statement)
+    await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", migration.version)
+
+
+async def _acquire_lock(conn) -> None:
+    # A process blocked in pg_advisory_lock is a running statement, and CREATE INDEX
+    # CONCURRENTLY in the lock holder waits for it to finish: the two would deadlock.
+    # Polling with pg_try_advisory_lock leaves no statement running between tries.
+    waiting = False
+    while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", _LOCK_ID):
+        if not waiting:
+            logger.info("Another process is applying migrations, waiting")
+            waiting = True
+        await asyncio.sleep(_LOCK_RETRY_SECONDS)
+
+
+async def migrate(database_url: Optional[str] = None) -> List[str]:
+    """Apply pending migrations; returns the versions applied by this call."""
+    conn = await asyncpg.connect(_dsn(database_url or settings.database_url))
+    applied_now = []
+    try:
+        # Serializes the bot and the webhook app when both start at once.
+        await _acquire_lock(conn)
+        try:
+            applied = await _applied_versions(conn)
+            for migration in discover():
+                if migration.version in applied:
+                    continue
+                logger.info("Applying migration %s", migration.version)
+                await _apply(conn, migration)
+                applied_now.append(migration.version)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", _LOCK_ID)
+    finally:
+        await conn.close()
+    return applied_now
+
+
+async def status(database_url: Optional[str] = None) -> List[tuple]:
+    conn = await asyncpg.connect(_dsn(database_url or settings.database_url))
+    try:
+        applied = await _applied_versions(conn)
+    finally:
+        await conn.close()
+    return [(migration.version, migration.version in applied) for migration in discover()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations and whether they are applied")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.status:
+        for version, applied in asyncio.run(status()):
+            print(f"{'applied' if applied else 'pending'}  {version}")
+        return
+    applied = asyncio.run(migrate())
+    print(f"Applied {len(applied)} migration(s)" + (f": {', '.join(applied)}" if applied else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+ALTER TABLE users ADD COLUMN IF NOT EXISTS result_cache_enabled BOOLEAN NOT NULL DEFAULT TRUE;
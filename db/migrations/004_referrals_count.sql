@@ -0,0 +1,11 @@
+ALTER TABLE users ADD COLUMN IF NOT EXISTS referrals_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE users u
+SET referrals_count = r.total
+FROM (
+    SELECT referrer_id, count(*) AS total
+    FROM referrals
+    GROUP BY referrer_id
+) r
+WHERE u.id = r.referrer_id
+  AND u.referrals_count <> r.total;
@@ -0,0 +1,20 @@
+-- migrate: no-transaction
+-- confirm_topup looks transactions up by the payment provider's order id.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_transactions_external_id
+    ON transactions (external_id)
+    WHERE external_id IS NOT NULL;
+
+-- find_user by @username.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_username ON users (username);
+
+-- Date-range reads of the action log.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_action_logs_created_at ON action_logs (created_at DESC);
+
+-- Per-user generation history, newest first; keyset pagination orders by
+-- (created_at, id). Also covers lookups by user_id alone.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_generations_user_created_id
+    ON generations (user_id, created_at DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_generations_user_id;
+
+-- Duplicates the index behind the UNIQUE constraint on users.tg_id.
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_tg_id;
@@ -0,0 +1,104 @@
+-- Monthly range partitions for action_logs. The existing rows are copied into
+-- the new partitioned table in this transaction, so run it in a quiet period
+-- on a large table.
+
+-- Creating a monthly partition fails while action_logs_default holds rows for
+-- that month, so in that case the function detaches the default partition,
+-- creates the month, moves those rows into it and re-attaches the default,
+-- all in the caller's transaction.
+
+CREATE OR REPLACE FUNCTION create_action_logs_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_at DATE := date_trunc('month', month)::DATE;
+    end_at DATE := (date_trunc('month', month) + INTERVAL '1 month')::DATE;
+    partition_name TEXT := 'action_logs_' || to_char(start_at, 'YYYYMM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM action_logs_default WHERE created_at >= start_at AND created_at < end_at
+    ) THEN
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF action_logs FOR VALUES FROM (%L) TO (%L)',
+            partition_name,
+            start_at,
+            end_at
+        );
+        RETURN partition_name;
+    END IF;
+
+    ALTER TABLE action_logs DETACH PARTITION action_logs_default;
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF action_logs FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        start_at,
+        end_at
+    );
+    WITH moved AS (
+        DELETE FROM action_logs_default
+        WHERE created_at >= start_at AND created_at < end_at
+        RETURNING *
+    )
+    INSERT INTO action_logs SELECT * FROM moved;
+    ALTER TABLE action_logs ATTACH PARTITION action_logs_default DEFAULT;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'action_logs'
+    ) THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE action_logs RENAME TO action_logs_legacy;
+    ALTER INDEX IF EXISTS idx_action_logs_created_at RENAME TO idx_action_logs_legacy_created_at;
+    -- Free the names the new table takes, otherwise it gets action_logs_pkey1 and action_logs_id_seq1.
+    ALTER INDEX IF EXISTS action_logs_pkey RENAME TO action_logs_legacy_pkey;
+    ALTER SEQUENCE IF EXISTS action_logs_id_seq RENAME TO action_logs_legacy_id_seq;
+
+    CREATE TABLE action_logs (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+        tg_id BIGINT NOT NULL,
+        username VARCHAR(255),
+        action VARCHAR(64) NOT NULL,
+        payload JSONB,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    CREATE INDEX idx_action_logs_created_at ON action_logs (created_at DESC);
+    -- Catches rows outside the monthly partitions so logging never fails.
+    CREATE TABLE action_logs_default PARTITION OF action_logs DEFAULT;
+
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT min(created_at) FROM action_logs_legacy), NOW())),
+            date_trunc('month', NOW()) + INTERVAL '3 months',
+            INTERVAL '1 month'
+        )::DATE
+    LOOP
+        PERFORM create_action_logs_partition(month);
+    END LOOP;
+
+    INSERT INTO action_logs (id, tg_id, username, action, payload, created_at)
+    SELECT id, tg_id, username, action, payload, COALESCE(created_at, NOW())
+    FROM action_logs_legacy;
+
+    PERFORM setval(
+        pg_get_serial_sequence('action_logs', 'id'),
+        COALESCE((SELECT max(id) FROM action_logs), 0) + 1,
+        false
+    );
+
+    DROP TABLE action_logs_legacy;
+END;
+$$;
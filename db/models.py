@@ -1,4 +1,4 @@
-from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Integer, Numeric, String, Text, func
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, ForeignKey, Integer, Numeric, String, Text, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -20,6 +20,8 @@ class User(Base):
     referrer_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     selected_model = Column(String(16), nullable=False, default="nano")
     selected_preset = Column(String(64))
+    result_cache_enabled = Column(Boolean, nullable=False, default=True)
+    referrals_count = Column(Integer, nullable=False, default=0)
 
     referrer = relationship("User", remote_side=[id], backref="referrals")
 
@@ -78,7 +80,7 @@ class Referral(Base):
 class ActionLog(Base):
     __tablename__ = "action_logs"
 
-    id = Column(Integer, primary_key=True)
+    id = Column(BigInteger, primary_key=True)
     tg_id = Column(BigInteger, nullable=False)
     username = Column(String(255))
     action = Column(String(64), nullable=False)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_PARTITION_NAME = re.compile(r"^action_logs_(\d{4})(\d{2})$")
+# Arbitrary constant shared by every process that runs partition maintenance.
+_LOCK_ID = 7_420_250_002
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class ActionLogPartitionManager:
+    """Keeps ``action_logs`` partitioned by month.
+
+    Creates the partitions for the next ``months_ahead`` months and drops
+    whole partitions older than ``retention_months`` (0 keeps everything),
+    so old logs go away without a DELETE. Only the rows that ended up in
+    ``action_logs_default`` are deleted row by row.
+    """
+
+    def __init__(self, months_ahead: int, retention_months: int, interval: float) -> None:
+        self._months_ahead = max(1, months_ahead)
+        self._retention_months = retention_months
+        self._interval = interval
+        self._session_factory = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, session_factory) -> None:
+        if self._task is not None:
+            return
+        self._session_factory = session_factory
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self, today: Optional[date] = None) -> List[str]:
+        """Create upcoming partitions and drop expired ones; returns the dropped names.
+
+        Every webhook worker runs maintenance, so a run first takes a
+        transaction-scoped advisory lock on a separate session and is skipped
+        when another process holds it. Rows already in ``action_logs_default``
+        for a new month are moved into its partition by
+        ``create_action_logs_partition`` (migration 006).
+        """
+        lock_session = self._session_factory()
+        try:
+            locked = await lock_session.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": _LOCK_ID})
+            if not locked.scalar_one():
+                logger.info("Action log partition maintenance is running elsewhere, skipping")
+                return []
+            return await self._maintain(today)
+        finally:
+            # Ends the transaction and with it the lock.
+            await lock_session.close()
+
+    async def _maintain(self, today: Optional[date]) -> List[str]:
+        today = today or datetime.now(timezone.utc).date()
+        current = today.replace(day=1)
+        session = self._session_factory()
+        try:
+            for offset in range(self._months_ahead + 1):
+                month = _add_months(current, offset)
+                try:
+                    await session.execute(text("SELECT create_action_logs_partition(:month)"), {"month": month})
+                    await session.commit()
+                except Exception as exc:  # noqa: BLE001
+                    await session.rollback()
+                    logger.warning("Could not create action log partition for %s: %s", month, exc)
+            if self._retention_months <= 0:
+                return []
+            cutoff = _add_months(current, -self._retention_months)
+            dropped = []
+            for name in await self._partitions(session):
+                match = _PARTITION_NAME.match(name)
+                month = date(int(match.group(1)), int(match.group(2)), 1)
+                if _add_months(month, 1) > cutoff:
+                    continue
+                await session.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                await session.commit()
+                dropped.append(name)
+                logger.info("Dropped expired action log partition %s", name)
+            result = await session.execute(
+                text("DELETE FROM action_logs_default WHERE created_at < CAST(:cutoff AS DATE)"),
+                {"cutoff": cutoff},
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info("Deleted %s expired rows from action_logs_default", result.rowcount)
+            return dropped
+        finally:
+            await session.close()
+
+    async def _partitions(self, session) -> List[str]:
+        result = await session.execute(
+            text(
+                """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'action_logs'
+                ORDER BY child.relname
+                """
+            )
+        )
+        return [name for name in result.scalars().all() if _PARTITION_NAME.match(name)]
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Action log partition maintenance failed: %s", exc)
+            await asyncio.sleep(self._interval)
+
+
+action_log_partitions = ActionLogPartitionManager(
+    months_ahead=settings.action_log_partitions_ahead,
+    retention_months=settings.action_log_retention_months,
+    interval=settings.action_log_maintenance_interval,
+)
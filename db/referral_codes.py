@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional
+
+from sqlalchemy import select
+
+from config import settings
+from db.models import User
+from utils.helpers import generate_referral_code
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReferralCodePool:
+    """Referral codes generated ahead of time and checked against ``users`` in bulk.
+
+    Signups take a code from the pool, so a /start burst needs no lookup per
+    candidate. A code is only "probably free": the insert still relies on the
+    unique constraint and retries with a fresh code on conflict.
+    """
+
+    def __init__(self, size: int, refill_interval: float) -> None:
+        self._size = size
+        self._refill_interval = refill_interval
+        self._codes: Deque[str] = deque()
+        self._session_factory = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def start(self, session_factory) -> None:
+        if self._size <= 0 or self._task is not None:
+            return
+        self._session_factory = session_factory
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def take(self) -> str:
+        if self._codes:
+            code = self._codes.popleft()
+            if len(self._codes) < self._size // 2:
+                self._wakeup.set()
+            return code
+        if self._task is not None:
+            self._wakeup.set()
+        return generate_referral_code()
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._refill()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Referral code pool refill failed: %s", exc)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._refill_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refill(self) -> None:
+        missing = self._size - len(self._codes)
+        if missing <= 0:
+            return
+        candidates = {generate_referral_code() for _ in range(missing)}
+        candidates.difference_update(self._codes)
+        session = self._session_factory()
+        try:
+            result = await session.execute(select(User.referral_code).where(User.referral_code.in_(candidates)))
+            taken = set(result.scalars().all())
+        finally:
+            await session.close()
+        self._codes.extend(candidates - taken)
+
+
+referral_code_pool = ReferralCodePool(
+    size=settings.referral_code_pool_size,
+    refill_interval=settings.referral_code_pool_refill_interval,
+)
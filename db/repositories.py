@@ -1,14 +1,22 @@
 from __future__ import annotations
 
+from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import AsyncIterator, Optional, Sequence, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import Integer, Numeric, String, bindparam, cast, func, insert, select, true, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
 from db.models import ActionLog, Generation, Referral, Transaction, User
-from utils.helpers import generate_referral_code
+from db.history_cache import history_cache
+from db.referral_codes import referral_code_pool
+from db.session import replica_read, replica_stream
+from db.user_cache import user_cache
+
+
+_REF_CODE_ATTEMPTS = 5
 
 
 async def get_user_by_tg_id(session: AsyncSession, tg_id: int) -> Optional[User]:
@@ -32,6 +40,7 @@ async def get_or_create_user(
         if username and user.username != username:
             user.username = username
             await session.commit()
+            await user_cache.invalidate(tg_id)
         return user
 
     referrer_id = None
@@ -40,43 +49,72 @@ async def get_or_create_user(
         if referrer and referrer.tg_id != tg_id:
             referrer_id = referrer.id
 
-    referral_code = await _generate_unique_ref_code(session)
-    user = User(
-        tg_id=tg_id,
-        username=username,
-        referral_code=referral_code,
-        referrer_id=referrer_id,
-    )
-    session.add(user)
-    await session.flush()
+    users = User.__table__
+    for _ in range(_REF_CODE_ATTEMPTS):
+        # ON CONFLICT covers both unique keys: a taken referral code is retried
+        # with a new one, a concurrent /start for the same tg_id returns that user.
+        stmt = (
+            pg_insert(users)
+            .values(
+                tg_id=tg_id,
+                username=username,
+                referral_code=referral_code_pool.take(),
+                referrer_id=referrer_id,
+            )
+            .on_conflict_do_nothing()
+            .returning(*users.c)
+        )
+        result = await session.execute(
+            select(User).from_statement(stmt).execution_options(populate_existing=True)
+        )
+        user = result.scalar_one_or_none()
+        if user is not None:
+            break
+        existing = await get_user_by_tg_id(session, tg_id)
+        if existing is not None:
+            await session.commit()
+            return existing
+    else:
+        raise RuntimeError("Could not allocate a unique referral code")
 
+    referrer_tg_id = None
     if referrer_id:
         session.add(Referral(referrer_id=referrer_id, referred_user_id=user.id))
+        result = await session.execute(
+            update(users)
+            .where(users.c.id == referrer_id)
+            .values(referrals_count=users.c.referrals_count + 1)
+            .returning(users.c.tg_id)
+        )
+        referrer_tg_id = result.scalar_one_or_none()
 
     await session.commit()
+    if referrer_tg_id is not None:
+        await user_cache.invalidate(referrer_tg_id)
     return user
 
 
-async def _generate_unique_ref_code(session: AsyncSession) -> str:
-    while True:
-        code = generate_referral_code()
-        result = await session.execute(select(User).where(User.referral_code == code))
-        if result.scalar_one_or_none() is None:
-            return code
+async def _update_user(session: AsyncSession, user_id: int, **values) -> None:
+    users = User.__table__
+    result = await session.execute(
+        update(users).where(users.c.id == user_id).values(**values).returning(users.c.tg_id)
+    )
+    tg_id = result.scalar_one_or_none()
+    await session.commit()
+    if tg_id is not None:
+        await user_cache.invalidate(tg_id)
 
 
 async def set_user_model(session: AsyncSession, user_id: int, model: str) -> None:
-    result = await session.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one()
-    user.selected_model = model
-    await session.commit()
+    await _update_user(session, user_id, selected_model=model)
 
 
 async def set_user_preset(session: AsyncSession, user_id: int, preset: Optional[str]) -> None:
-    result = await session.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one()
-    user.selected_preset = preset
-    await session.commit()
+    await _update_user(session, user_id, selected_preset=preset)
+
+
+async def set_user_result_cache(session: AsyncSession, user_id: int, enabled: bool) -> None:
+    await _update_user(session, user_id, result_cache_enabled=enabled)
 
 
 async def adjust_balances(
@@ -87,39 +125,243 @@ async def adjust_balances(
     usdt_delta: Decimal = Decimal("0"),
     earned_usdt_delta: Decimal = Decimal("0"),
 ) -> User:
-    result = await session.execute(select(User).where(User.id == user_id))
+    users = User.__table__
+    stmt = (
+        update(users)
+        .where(users.c.id == user_id)
+        .values(
+            diamonds=users.c.diamonds + diamonds_delta,
+            bananas=users.c.bananas + bananas_delta,
+            usdt_balance=users.c.usdt_balance + usdt_delta,
+            earned_usdt=users.c.earned_usdt + earned_usdt_delta,
+        )
+        .returning(*users.c)
+    )
+    result = await session.execute(
+        select(User).from_statement(stmt).execution_options(populate_existing=True)
+    )
     user = result.scalar_one()
-    user.diamonds += diamonds_delta
-    user.bananas += bananas_delta
-    user.usdt_balance += usdt_delta
-    user.earned_usdt += earned_usdt_delta
     await session.commit()
+    await user_cache.invalidate(user.tg_id)
     return user
 
 
-async def create_generation(
+async def _credit_refunds(session: AsyncSession, refunds: Sequence[Tuple[int, int, int]]) -> list:
+    users = User.__table__
+    tg_ids = await session.execute(
+        select(users.c.tg_id).where(users.c.id.in_({user_id for user_id, _, _ in refunds}))
+    )
+    stmt = (
+        update(users)
+        .where(users.c.id == bindparam("target_id"))
+        .values(
+            diamonds=users.c.diamonds + bindparam("diamonds_delta"),
+            bananas=users.c.bananas + bindparam("bananas_delta"),
+        )
+    )
+    await session.execute(
+        stmt,
+        [
+            {"target_id": user_id, "diamonds_delta": diamonds, "bananas_delta": bananas}
+            for user_id, diamonds, bananas in refunds
+        ],
+    )
+    return tg_ids.scalars().all()
+
+
+async def fail_and_refund_generations(
+    session: AsyncSession,
+    refunds: Sequence[Tuple[int, int, int, int]],
+    error: str,
+) -> int:
+    """Fail ``(generation_id, user_id, diamonds, bananas)`` generations and refund them in one transaction.
+
+    Only generations still ``processing`` are failed and refunded, so a job
+    that completed or refunded itself meanwhile is left alone. Returns the
+    number of refunded generations.
+    """
+    if not refunds:
+        return 0
+    generations = Generation.__table__
+    result = await session.execute(
+        update(generations)
+        .where(
+            generations.c.id.in_([generation_id for generation_id, _, _, _ in refunds]),
+            generations.c.status == "processing",
+        )
+        .values(status="failed", error=error)
+        .returning(generations.c.id)
+    )
+    failed = set(result.scalars().all())
+    credits = [
+        (user_id, diamonds, bananas)
+        for generation_id, user_id, diamonds, bananas in refunds
+        if generation_id in failed
+    ]
+    tg_ids = await _credit_refunds(session, credits) if credits else []
+    await session.commit()
+    await user_cache.invalidate(*tg_ids)
+    return len(failed)
+
+
+async def fail_stale_generations(session: AsyncSession, created_before: datetime, error: str) -> int:
+    """Fail and refund generations left ``processing`` since before ``created_before``, in one statement.
+
+    The job queue lives in memory, so after a crash nothing else would ever
+    finish these rows. Refunds come from the rows' own ``cost_*`` columns.
+    Returns the number of refunded users.
+    """
+    generations = Generation.__table__
+    users = User.__table__
+    failed = (
+        update(generations)
+        .where(generations.c.status == "processing", generations.c.created_at < created_before)
+        .values(status="failed", error=error)
+        .returning(generations.c.user_id, generations.c.cost_diamonds, generations.c.cost_bananas)
+        .cte("failed")
+    )
+    totals = (
+        select(
+            failed.c.user_id,
+            func.sum(failed.c.cost_diamonds).label("diamonds"),
+            func.sum(failed.c.cost_bananas).label("bananas"),
+        )
+        .group_by(failed.c.user_id)
+        .cte("totals")
+    )
+    result = await session.execute(
+        update(users)
+        .where(users.c.id == totals.c.user_id)
+        .values(diamonds=users.c.diamonds + totals.c.diamonds, bananas=users.c.bananas + totals.c.bananas)
+        .returning(users.c.tg_id)
+    )
+    tg_ids = result.scalars().all()
+    await session.commit()
+    await user_cache.invalidate(*tg_ids)
+    return len(tg_ids)
+
+
+def _typed_literals(table, values: dict) -> list:
+    # Bind parameters in a SELECT list carry no type for Postgres; cast them to the target column types.
+    return [cast(value, table.c[name].type) for name, value in values.items()]
+
+
+async def debit_and_create_generation(
     session: AsyncSession,
     user_id: int,
+    *,
+    cost_diamonds: int,
+    cost_bananas: int,
+    method: Optional[str],
+    payload: Optional[dict],
     kind: str,
     model: Optional[str],
     prompt: Optional[str],
     preset: Optional[str],
-    cost_diamonds: int = 0,
-    cost_bananas: int = 0,
-) -> Generation:
-    generation = Generation(
-        user_id=user_id,
-        kind=kind,
-        model=model,
-        prompt=prompt,
-        preset=preset,
-        cost_diamonds=cost_diamonds,
-        cost_bananas=cost_bananas,
-        status="processing",
-    )
-    session.add(generation)
+) -> Optional[int]:
+    """Charge the user and record the spend and the generation in one statement.
+
+    Returns the new generation id, or ``None`` when the balance no longer
+    covers the cost (nothing is written in that case).
+    """
+    users = User.__table__
+    transactions = Transaction.__table__
+    generations = Generation.__table__
+    debit = (
+        update(users)
+        .where(
+            users.c.id == user_id,
+            users.c.diamonds >= cost_diamonds,
+            users.c.bananas >= cost_bananas,
+        )
+        .values(
+            diamonds=users.c.diamonds - cost_diamonds,
+            bananas=users.c.bananas - cost_bananas,
+        )
+        .returning(users.c.id, users.c.tg_id)
+        .cte("debit")
+    )
+    spend_values = {
+        "type": "spend",
+        "method": method,
+        "status": "paid",
+        "amount_diamonds": cost_diamonds,
+        "amount_bananas": cost_bananas,
+        # Column defaults are not applied to INSERT ... SELECT; every NOT NULL column is listed.
+        "amount_usdt": Decimal("0"),
+        "payload": payload,
+    }
+    spend = (
+        insert(transactions)
+        .from_select(
+            ["user_id", *spend_values],
+            select(debit.c.id, *_typed_literals(transactions, spend_values)),
+        )
+        .cte("spend")
+    )
+    generation_values = {
+        "kind": kind,
+        "model": model,
+        "prompt": prompt,
+        "preset": preset,
+        "status": "processing",
+        "cost_diamonds": cost_diamonds,
+        "cost_bananas": cost_bananas,
+    }
+    created = (
+        insert(generations)
+        .from_select(
+            ["user_id", *generation_values],
+            select(debit.c.id, *_typed_literals(generations, generation_values)),
+        )
+        .returning(generations.c.id, generations.c.user_id)
+        .cte("created")
+    )
+    stmt = (
+        select(created.c.id, debit.c.tg_id)
+        .select_from(created.join(debit, debit.c.id == created.c.user_id))
+        .add_cte(spend)
+    )
+    result = await session.execute(stmt)
+    row = result.one_or_none()
+    await session.commit()
+    if row is None:
+        return None
+    await user_cache.invalidate(row.tg_id)
+    return row.id
+
+
+async def create_cached_generation(
+    session: AsyncSession,
+    user_id: int,
+    *,
+    kind: str,
+    model: Optional[str],
+    prompt: Optional[str],
+    preset: Optional[str],
+    result_url: str,
+) -> int:
+    """Record a generation served from the result cache: completed and free of charge."""
+    generations = Generation.__table__
+    result = await session.execute(
+        insert(generations)
+        .values(
+            user_id=user_id,
+            kind=kind,
+            model=model,
+            prompt=prompt,
+            preset=preset,
+            status="completed",
+            result_url=result_url,
+            cost_diamonds=0,
+            cost_bananas=0,
+        )
+        .returning(generations.c.id)
+    )
+    generation_id = result.scalar_one()
     await session.commit()
-    return generation
+    history_cache.invalidate(user_id)
+    return generation_id
 
 
 async def update_generation_status(
@@ -129,12 +371,76 @@ async def update_generation_status(
     result_url: Optional[str] = None,
     error: Optional[str] = None,
 ) -> None:
-    result = await session.execute(select(Generation).where(Generation.id == generation_id))
-    generation = result.scalar_one()
-    generation.status = status
-    generation.result_url = result_url
-    generation.error = error
+    generations = Generation.__table__
+    result = await session.execute(
+        update(generations)
+        .where(generations.c.id == generation_id)
+        .values(status=status, result_url=result_url, error=error)
+        .returning(generations.c.user_id)
+    )
+    user_id = result.scalar_one_or_none()
     await session.commit()
+    if user_id is not None and status == "completed":
+        history_cache.invalidate(user_id)
+
+
+async def get_generations_page(
+    session: AsyncSession,
+    user_id: int,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: int = 10,
+) -> Tuple[list, bool]:
+    """One page of a user's completed generations, newest first, by keyset on ``(created_at, id)``.
+
+    ``before`` gives the page after that cursor, ``after`` the page before it.
+    The second value tells whether more rows exist beyond the page in the
+    direction of travel.
+    """
+    generations = Generation.__table__
+    cursor = tuple_(generations.c.created_at, generations.c.id)
+    stmt = select(
+        generations.c.id,
+        generations.c.kind,
+        generations.c.model,
+        generations.c.preset,
+        func.left(generations.c.prompt, 40).label("prompt"),
+        generations.c.created_at,
+    ).where(
+        generations.c.user_id == user_id,
+        generations.c.status == "completed",
+        generations.c.result_url.isnot(None),
+    )
+    if after is not None:
+        stmt = stmt.where(cursor > tuple_(*after)).order_by(generations.c.created_at, generations.c.id)
+    else:
+        if before is not None:
+            stmt = stmt.where(cursor < tuple_(*before))
+        stmt = stmt.order_by(generations.c.created_at.desc(), generations.c.id.desc())
+    result = await session.execute(stmt.limit(limit + 1))
+    rows = list(result.all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    return rows, has_more
+
+
+# Pages past the first are not cached, so replica lag only affects the one response.
+get_generations_page_from_replica = replica_read(get_generations_page)
+
+
+@replica_read
+async def get_generation_result(session: AsyncSession, user_id: int, generation_id: int):
+    generations = Generation.__table__
+    result = await session.execute(
+        select(generations.c.kind, generations.c.result_url).where(
+            generations.c.id == generation_id,
+            generations.c.user_id == user_id,
+            generations.c.status == "completed",
+        )
+    )
+    return result.one_or_none()
 
 
 async def create_transaction(
@@ -171,44 +477,95 @@ async def get_transaction_by_external_id(session: AsyncSession, external_id: str
 
 
 async def confirm_topup(session: AsyncSession, external_id: str) -> Optional[Transaction]:
-    tx = await get_transaction_by_external_id(session, external_id)
-    if not tx or tx.status != "pending":
-        return None
-
-    result = await session.execute(select(User).where(User.id == tx.user_id))
-    user = result.scalar_one()
-    user.diamonds += tx.amount_diamonds
-    user.bananas += tx.amount_bananas
-    tx.status = "paid"
-
-    if user.referrer_id:
-        percent = Decimal(str(settings.referral_percent))
-        bonus_usdt = (Decimal(tx.amount_diamonds) * percent) / Decimal("100")
-        bonus_usdt = bonus_usdt.quantize(Decimal("0.01"))
-        ref_result = await session.execute(select(User).where(User.id == user.referrer_id))
-        referrer = ref_result.scalar_one()
-        referrer.usdt_balance += bonus_usdt
-        referrer.earned_usdt += bonus_usdt
-        session.add(
-            Transaction(
-                user_id=referrer.id,
-                type="referral_bonus",
-                method=tx.method,
-                status="paid",
-                amount_usdt=bonus_usdt,
-                payload={"source_tx": tx.external_id},
-            )
+    """Mark a pending top-up paid and credit it, once, in a single statement.
+
+    The ``status = 'pending'`` guard on the UPDATE makes concurrent
+    confirmations of one order race on the row lock: the first one wins, the
+    rest match nothing and return ``None``. The user's balance, the referrer's
+    bonus and the bonus transaction are data-modifying CTEs of the same
+    statement. Returns a detached ``Transaction`` snapshot.
+    """
+    transactions = Transaction.__table__
+    users = User.__table__
+    paid = (
+        update(transactions)
+        .where(transactions.c.external_id == external_id, transactions.c.status == "pending")
+        .values(status="paid")
+        .returning(*transactions.c)
+        .cte("paid")
+    )
+    credited = (
+        update(users)
+        .where(users.c.id == paid.c.user_id)
+        .values(
+            diamonds=users.c.diamonds + paid.c.amount_diamonds,
+            bananas=users.c.bananas + paid.c.amount_bananas,
         )
-
+        .returning(
+            users.c.id,
+            users.c.tg_id,
+            users.c.referrer_id,
+            paid.c.amount_diamonds,
+            paid.c.method,
+            paid.c.external_id,
+        )
+        .cte("credited")
+    )
+    rate = cast(Decimal(str(settings.referral_percent)) / 100, Numeric(10, 6))
+    # Computed in a plain SELECT: SQLAlchemy 1.4 misorders positional binds placed in a CTE's RETURNING.
+    referral = select(
+        credited.c.id,
+        credited.c.referrer_id,
+        credited.c.method,
+        credited.c.external_id,
+        func.round(credited.c.amount_diamonds * rate, cast(2, Integer)).label("bonus"),
+    ).cte("referral")
+    # A row may be updated by only one CTE of a statement, so the buyer is never its own referrer here.
+    rewarded = (
+        update(users)
+        .where(users.c.id == referral.c.referrer_id, users.c.id != referral.c.id)
+        .values(
+            usdt_balance=users.c.usdt_balance + referral.c.bonus,
+            earned_usdt=users.c.earned_usdt + referral.c.bonus,
+        )
+        .returning(users.c.id, users.c.tg_id, referral.c.bonus, referral.c.method, referral.c.external_id)
+        .cte("rewarded")
+    )
+    # Column defaults are not applied to INSERT ... SELECT; every NOT NULL column is listed.
+    bonus_values = {"type": "referral_bonus", "status": "paid", "amount_diamonds": 0, "amount_bananas": 0}
+    bonus_tx = (
+        insert(transactions)
+        .from_select(
+            ["user_id", "method", "amount_usdt", "payload", *bonus_values],
+            select(
+                rewarded.c.id,
+                rewarded.c.method,
+                rewarded.c.bonus,
+                func.jsonb_build_object(cast("source_tx", String), rewarded.c.external_id),
+                *_typed_literals(transactions, bonus_values),
+            ),
+        )
+        .cte("bonus_tx")
+    )
+    stmt = (
+        select(
+            *paid.c,
+            credited.c.tg_id.label("user_tg_id"),
+            select(rewarded.c.tg_id).scalar_subquery().label("referrer_tg_id"),
+        )
+        .select_from(paid.join(credited, true()))
+        .add_cte(bonus_tx)
+    )
+    result = await session.execute(stmt)
+    row = result.one_or_none()
     await session.commit()
-    return tx
-
-
-async def get_referrals_count(session: AsyncSession, user_id: int) -> int:
-    result = await session.execute(select(Referral).where(Referral.referrer_id == user_id))
-    return len(result.scalars().all())
+    if row is None:
+        return None
+    await user_cache.invalidate(*(tg_id for tg_id in (row.user_tg_id, row.referrer_tg_id) if tg_id is not None))
+    return Transaction(**{column.key: row._mapping[column.key] for column in transactions.c})
 
 
+@replica_read
 async def find_user(session: AsyncSession, query: str) -> Optional[User]:
     if query.isdigit():
         result = await session.execute(select(User).where(User.tg_id == int(query)))
@@ -230,6 +587,34 @@ async def log_action(
     return entry
 
 
-async def get_action_logs(session: AsyncSession, limit: int = 1000) -> list[ActionLog]:
-    result = await session.execute(select(ActionLog).order_by(ActionLog.created_at.desc()).limit(limit))
-    return list(result.scalars().all())
+async def log_actions(session: AsyncSession, entries: Sequence[dict]) -> None:
+    """Insert many ``action_logs`` rows with a single multi-row INSERT."""
+    if not entries:
+        return
+    await session.execute(insert(ActionLog.__table__).values(list(entries)))
+    await session.commit()
+
+
+@replica_stream
+async def stream_action_logs(
+    session: AsyncSession,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    action: Optional[str] = None,
+    tg_id: Optional[int] = None,
+    chunk_size: int = 5000,
+) -> AsyncIterator[Sequence]:
+    """Yield matching ``action_logs`` rows oldest first, ``chunk_size`` at a time, from a server-side cursor."""
+    logs = ActionLog.__table__
+    stmt = select(logs).order_by(logs.c.created_at, logs.c.id)
+    if date_from is not None:
+        stmt = stmt.where(logs.c.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(logs.c.created_at < date_to)
+    if action is not None:
+        stmt = stmt.where(logs.c.action == action)
+    if tg_id is not None:
+        stmt = stmt.where(logs.c.tg_id == tg_id)
+    result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions(chunk_size):
+        yield rows
@@ -1,12 +1,225 @@
+import functools
+import time
+import uuid
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from config import settings
 
 
-def create_engine():
-    return create_async_engine(settings.database_url, echo=False, future=True)
+_STATEMENTS_KEY = "nanobanana_statements"
+_REPLICA_KEY = "nanobanana_replica"
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        wait = time.monotonic() - started
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.wait_total, pool.wait_max = self.wait_total, self.wait_max
+        return pool
+
+
+class PgBouncerConnection(asyncpg.Connection):
+    """asyncpg connection that gives every prepared statement a unique name.
+
+    SQLAlchemy 1.4 still prepares a named statement per query with the caches
+    off, and asyncpg numbers the names from 1 in every process. Behind
+    PgBouncer in transaction mode clients share server connections, so two
+    processes would both prepare ``__asyncpg_stmt_1__`` on one of them.
+    """
+
+    def _get_unique_id(self, prefix: str) -> str:
+        return f"__asyncpg_{prefix}_{uuid.uuid4().hex}__"
+
+
+def create_engine(database_url: Optional[str] = None):
+    # PgBouncer in transaction mode cannot keep server-side prepared statements
+    # between transactions, so both asyncpg's and SQLAlchemy's caches are off.
+    cache_size = 0 if settings.db_pgbouncer else settings.db_statement_cache_size
+    connect_args = {
+        "statement_cache_size": cache_size,
+        "prepared_statement_cache_size": cache_size,
+    }
+    if settings.db_pgbouncer:
+        connect_args["connection_class"] = PgBouncerConnection
+    engine = create_async_engine(
+        database_url or settings.database_url,
+        echo=False,
+        future=True,
+        poolclass=MeteredPool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+    _count_statements(engine)
+    return engine
+
+
+def create_replica_engine():
+    """Engine for ``DATABASE_REPLICA_URL``, or ``None`` when no replica is configured."""
+    if not settings.database_replica_url:
+        return None
+    return create_engine(settings.database_replica_url)
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.sync_engine.pool
+    checkouts = getattr(pool, "checkouts", 0)
+    return {
+        "size": pool.size(),
+        "in_use": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": checkouts,
+        "timeouts": getattr(pool, "timeouts", 0),
+        "wait_avg": getattr(pool, "wait_total", 0.0) / checkouts if checkouts else 0.0,
+        "wait_max": getattr(pool, "wait_max", 0.0),
+    }
+
+
+class RoutingSession(Session):
+    """Sends reads marked by ``replica_read`` to the replica engine, everything else to the primary.
+
+    A session with pending changes or mid-flush always uses the primary, so
+    it reads its own writes.
+    """
+
+    replica_bind = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self.replica_bind is not None
+            and self.info.get(_REPLICA_KEY)
+            and not self._flushing
+            and not (self.new or self.dirty or self.deleted)
+        ):
+            return self.replica_bind
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+def create_session_factory(engine, replica_engine=None) -> sessionmaker:
+    if replica_engine is None:
+        return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    sync_session_class = type(
+        "ReplicaRoutingSession",
+        (RoutingSession,),
+        {"replica_bind": replica_engine.sync_engine},
+    )
+    return sessionmaker(engine, class_=AsyncSession, sync_session_class=sync_session_class, expire_on_commit=False)
+
+
+def replica_read(func):
+    """Mark a repository function (``session`` first) as safe to serve from the replica."""
+
+    @functools.wraps(func)
+    async def wrapper(session, *args, **kwargs):
+        info = session.info
+        previous = info.get(_REPLICA_KEY, False)
+        info[_REPLICA_KEY] = True
+        try:
+            return await func(session, *args, **kwargs)
+        finally:
+            info[_REPLICA_KEY] = previous
+
+    return wrapper
+
+
+def replica_stream(func):
+    """``replica_read`` for async-generator repository functions."""
+
+    @functools.wraps(func)
+    async def wrapper(session, *args, **kwargs):
+        info = session.info
+        previous = info.get(_REPLICA_KEY, False)
+        info[_REPLICA_KEY] = True
+        try:
+            async for item in func(session, *args, **kwargs):
+                yield item
+        finally:
+            info[_REPLICA_KEY] = previous
+
+    return wrapper
+
+
+class LazySession:
+    """Stand-in for an ``AsyncSession`` that creates the real one on first use.
+
+    Updates that never touch the database cost no session and no pooled
+    connection. ``statements`` is the number of SQL statements the session
+    has executed so far.
+    """
+
+    def __init__(self, session_factory) -> None:
+        self._session_factory = session_factory
+        self._session = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    @property
+    def statements(self) -> int:
+        if self._session is None:
+            return 0
+        return self._session.info.get("statements", 0)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._session_factory()
+        return getattr(self._session, name)
+
+
+def _count_statements(engine) -> None:
+    # A session tags the connection it checks out with its ``info`` dict; every
+    # cursor execution on that connection bumps the session's counter.
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        info = conn.info.get(_STATEMENTS_KEY)
+        if info is not None:
+            info["statements"] = info.get("statements", 0) + 1
+
+    @event.listens_for(sync_engine.pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        if connection_record is not None:
+            connection_record.info.pop(_STATEMENTS_KEY, None)
 
 
-def create_session_factory(engine) -> sessionmaker:
-    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+@event.listens_for(Session, "after_begin")
+def _tag_connection(session, transaction, connection):
+    connection.info[_STATEMENTS_KEY] = session.info
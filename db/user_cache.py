@@ -0,0 +1,152 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, Tuple
+
+from sqlalchemy import DateTime, Numeric
+
+from config import settings
+from db.models import User
+from utils.redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = list(User.__table__.columns)
+
+
+def dump_user(user: User) -> dict:
+    return {column.key: getattr(user, column.key) for column in _COLUMNS}
+
+
+def load_user(data: dict) -> User:
+    """Detached ``User`` built from a snapshot; safe to read and mutate locally."""
+    return User(**data)
+
+
+def _encode(data: dict) -> str:
+    def default(value):
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Cannot encode {type(value)!r}")
+
+    return json.dumps(data, default=default)
+
+
+def _decode(raw) -> dict:
+    data = json.loads(raw)
+    for column in _COLUMNS:
+        value = data.get(column.key)
+        if value is None:
+            continue
+        if isinstance(column.type, Numeric):
+            data[column.key] = Decimal(value)
+        elif isinstance(column.type, DateTime):
+            data[column.key] = datetime.fromisoformat(value)
+    return data
+
+
+class MemoryUserCache:
+    def __init__(self, ttl_seconds: int, max_entries: int) -> None:
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, tg_id: int) -> Optional[User]:
+        entry = self._entries.get(tg_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(tg_id, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(tg_id)
+        self.hits += 1
+        return load_user(entry[1])
+
+    async def set(self, user: User) -> None:
+        self._entries[user.tg_id] = (time.monotonic() + self._ttl, dump_user(user))
+        self._entries.move_to_end(user.tg_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def invalidate(self, *tg_ids: int) -> None:
+        for tg_id in tg_ids:
+            self._entries.pop(tg_id, None)
+
+
+class RedisUserCache:
+    _prefix = "nanobanana:user:"
+
+    def __init__(self, redis, ttl_seconds: int) -> None:
+        self._redis = redis
+        self._ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, tg_id: int) -> Optional[User]:
+        try:
+            raw = await self._redis.get(f"{self._prefix}{tg_id}")
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("User cache lookup failed: %s", exc)
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return load_user(_decode(raw))
+
+    async def set(self, user: User) -> None:
+        try:
+            await self._redis.set(f"{self._prefix}{user.tg_id}", _encode(dump_user(user)), ex=self._ttl)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("User cache store failed: %s", exc)
+
+    async def invalidate(self, *tg_ids: int) -> None:
+        if not tg_ids:
+            return
+        try:
+            await self._redis.delete(*(f"{self._prefix}{tg_id}" for tg_id in tg_ids))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("User cache invalidation failed: %s", exc)
+
+
+class NullUserCache:
+    async def get(self, tg_id: int) -> Optional[User]:
+        return None
+
+    async def set(self, user: User) -> None:
+        return None
+
+    async def invalidate(self, *tg_ids: int) -> None:
+        return None
+
+
+def build_user_cache():
+    """Pick the backend; a process-local cache is only safe when this is the only writer.
+
+    Balances are also changed by ``webhook_app.py`` and by other webhook
+    workers, whose invalidations never reach another process's memory, so
+    ``auto`` uses Redis when it is configured and no cache otherwise.
+    """
+    backend = settings.user_cache_backend
+    if backend == "auto":
+        backend = "redis" if settings.redis_url else "none"
+    if backend == "redis":
+        redis = get_redis()
+        if redis is None:
+            raise RuntimeError("USER_CACHE_BACKEND=redis needs REDIS_URL and the redis package")
+        return RedisUserCache(redis, settings.user_cache_ttl)
+    if backend == "memory":
+        if settings.bot_processes > 1:
+            raise RuntimeError("USER_CACHE_BACKEND=memory is per process; use redis or none with WEBHOOK_WORKERS > 1")
+        return MemoryUserCache(settings.user_cache_ttl, settings.user_cache_max_entries)
+    return NullUserCache()
+
+
+user_cache = build_user_cache()
@@ -1,4 +1,9 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
+from functools import partial
+from typing import Set, Tuple
 
 from aiogram import types
 from aiogram.dispatcher import FSMContext
@@ -11,16 +16,20 @@ from db.repositories import (
     confirm_topup,
     create_transaction,
     find_user,
-    get_referrals_count,
-    get_action_logs,
     get_user_by_tg_id,
     log_action,
 )
 from keyboards.admin import admin_main_kb, admin_user_kb
+from services.log_export import FORMATS as LOG_EXPORT_FORMATS, LogExportFilters, export_action_logs
+from services.metrics import metrics
+from services.outbound import PRIORITY_RESULT, outbound
 from utils.states import AdminStates
 from utils.helpers import format_profile
 
 
+logger = logging.getLogger(__name__)
+
+
 def _is_admin(user_id: int) -> bool:
     return user_id in settings.admin_ids
 
@@ -135,33 +144,82 @@ async def _prompt_user_query(target, state: FSMContext, operation: str):
     await target.edit_text("Введите tg_id или username пользователя")
 
 
-async def _export_logs(message: types.Message, session: AsyncSession) -> None:
-    logs = await get_action_logs(session)
-    if not logs:
-        await message.answer("Логи пустые.")
-        return
-    import csv
-    import io
-    from aiogram.types import InputFile
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["id", "tg_id", "username", "action", "payload", "created_at"])
-    for entry in reversed(logs):
-        writer.writerow(
-            [
-                entry.id,
-                entry.tg_id,
-                entry.username or "",
-                entry.action,
-                entry.payload,
-                entry.created_at,
-            ]
-        )
-    buffer.seek(0)
-    await message.answer_document(InputFile(io.BytesIO(buffer.read().encode("utf-8")), filename="action_logs.csv"))
-
-
-async def admin_callback(query: types.CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
+_EXPORT_USAGE = (
+    "Формат: /export_logs [from=YYYY-MM-DD] [to=YYYY-MM-DD] [action=...] [tg_id=...] [format=csv|jsonl]"
+)
+_export_tasks: Set[asyncio.Task] = set()
+
+
+def _parse_export_args(args: str) -> Tuple[LogExportFilters, str]:
+    filters = LogExportFilters()
+    fmt = "csv"
+    for part in args.split():
+        key, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(part)
+        if key == "from":
+            filters.date_from = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+        elif key == "to":
+            # Inclusive day: everything before the start of the next one.
+            filters.date_to = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+        elif key == "action":
+            filters.action = value
+        elif key == "tg_id":
+            filters.tg_id = int(value)
+        elif key == "format" and value in LOG_EXPORT_FORMATS:
+            fmt = value
+        else:
+            raise ValueError(part)
+    return filters, fmt
+
+
+async def _run_export(message: types.Message, session_factory, filters: LogExportFilters, fmt: str) -> None:
+    try:
+        export = await export_action_logs(session_factory, filters, fmt)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Action log export failed")
+        await outbound.send(message.chat.id, partial(message.answer, f"Не удалось выгрузить логи: {exc}"))
+        return
+    with export:
+        if not export.rows:
+            await outbound.send(message.chat.id, partial(message.answer, "Логи пустые."))
+            return
+        count = len(export.parts)
+        for index, part in enumerate(export.parts, start=1):
+            caption = f"Строк: {part.rows}" if count == 1 else f"Часть {index}/{count}, строк: {part.rows}"
+            await outbound.send(
+                message.chat.id,
+                # A retry after RetryAfter needs a fresh file handle; the first attempt read this one to the end.
+                lambda: message.answer_document(part.buffer.as_input_file(part.filename), caption=caption),
+                PRIORITY_RESULT,
+            )
+
+
+async def _export_logs(message: types.Message, session_factory, args: str = "") -> None:
+    try:
+        filters, fmt = _parse_export_args(args)
+    except ValueError:
+        await message.answer(_EXPORT_USAGE)
+        return
+    await message.answer("Выгрузка запущена, файл придёт по готовности.")
+    task = asyncio.create_task(_run_export(message, session_factory, filters, fmt))
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
+
+
+async def export_logs_command(message: types.Message, session_factory) -> None:
+    if not _is_admin(message.from_user.id):
+        return
+    await _export_logs(message, session_factory, message.get_args() or "")
+
+
+async def stats_command(message: types.Message) -> None:
+    if not _is_admin(message.from_user.id):
+        return
+    await message.answer(metrics.render(), parse_mode=None)
+
+
+async def admin_callback(query: types.CallbackQuery, state: FSMContext, session_factory) -> None:
     if not _is_admin(query.from_user.id):
         await query.answer("Нет доступа", show_alert=True)
         return
@@ -176,8 +234,8 @@ async def admin_callback(query: types.CallbackQuery, state: FSMContext, session:
         await query.answer()
         return
     if action == "export":
-        await _export_logs(query.message, session)
-        await query.answer("Готово")
+        await _export_logs(query.message, session_factory)
+        await query.answer()
         return
     await query.answer()
 
@@ -210,8 +268,7 @@ async def admin_user_query_input(message: types.Message, state: FSMContext, sess
         return
     await state.update_data(target_tg_id=user.tg_id)
     if operation == "find":
-        referrals = await get_referrals_count(session, user.id)
-        info = format_profile(user, referrals_count=referrals, available_tokens=user.diamonds + user.bananas)
+        info = format_profile(user, referrals_count=user.referrals_count, available_tokens=user.diamonds + user.bananas)
         await message.answer(f"Пользователь:\n{info}", reply_markup=admin_user_kb(user.tg_id))
         await state.finish()
         return
@@ -294,6 +351,8 @@ def register(dp):
     dp.register_message_handler(admin_sub, Command("admin_sub"))
     dp.register_message_handler(admin_find, Command("admin_find"))
     dp.register_message_handler(confirm_order, Command("confirm_order"))
+    dp.register_message_handler(export_logs_command, Command("export_logs"))
+    dp.register_message_handler(stats_command, Command("stats"))
     dp.register_message_handler(admin_panel, Command("admin_panel"), state="*")
     dp.register_callback_query_handler(admin_user_action, Text(startswith="admin:user:"), state="*")
     dp.register_callback_query_handler(admin_callback, Text(startswith="admin:"), state="*")
@@ -1,5 +1,4 @@
-import asyncio
-from io import BytesIO
+from functools import partial
 from typing import Optional
 
 from aiogram import types
@@ -10,13 +9,18 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
 from db.repositories import (
-    adjust_balances,
-    create_generation,
-    create_transaction,
-    get_user_by_tg_id,
+    create_cached_generation,
+    debit_and_create_generation,
+    fail_and_refund_generations,
     update_generation_status,
 )
+from db.models import User
+from services.image_prep import pick_photo_size, target_side
 from services.nanobanana import NanoBananaClient
+from services.outbound import PRIORITY_NOTICE, PRIORITY_RESULT, outbound
+from services.progress import progress_ticker
+from services.result_cache import preset_cache, preset_cache_key, text2img_cache, text2img_cache_key
+from services.scheduler import GenerationJob, QueueFullError, generation_scheduler
 from utils.constants import (
     ANIMATE_WARNINGS,
     BTN_ANIMATE,
@@ -27,6 +31,7 @@ from utils.constants import (
     MAIN_MENU_BUTTONS,
     PROFILE_MENU_BUTTONS,
 )
+from utils.presets import get_preset
 from utils.states import GenerationStates
 from utils.tokens import select_token_cost
 
@@ -44,64 +49,48 @@ def _is_menu_text(text: str) -> bool:
     return False
 
 
-async def _start_progress_message(
-    message: types.Message,
-    prefix: str,
-    total_seconds: int = 40,
-    step_seconds: int = 5,
-):
-    try:
-        progress_message = await message.answer(f"{prefix}... ~{total_seconds} сек осталось")
-    except Exception:
-        return None, None, None
-
-    stop_event = asyncio.Event()
-
-    async def _updater():
-        remaining = total_seconds
-        while remaining > 0:
-            try:
-                await asyncio.wait_for(stop_event.wait(), timeout=step_seconds)
-                break
-            except asyncio.TimeoutError:
-                remaining = max(0, remaining - step_seconds)
-                next_text = (
-                    f"{prefix}... ~{remaining} сек осталось" if remaining > 0 else f"{prefix} почти готово..."
-                )
-                try:
-                    await progress_message.edit_text(next_text)
-                except Exception:
-                    pass
-
-    task = asyncio.create_task(_updater())
-    return progress_message, stop_event, task
-
-
-async def _finish_progress_message(progress_message, stop_event, task, final_text: str) -> None:
-    if stop_event:
-        stop_event.set()
-    if task:
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
-    if progress_message:
-        try:
-            await progress_message.edit_text(final_text)
-        except Exception:
-            pass
-
-
 def _estimate_processing_time(model: Optional[str]) -> int:
     if model == "pro":
         return 45
     return 30
 
 
-async def handle_text_prompt(message: types.Message, session: AsyncSession) -> None:
+async def _enqueue_generation(
+    message: types.Message,
+    session: AsyncSession,
+    *,
+    lane: str,
+    generation_id: int,
+    user_id: int,
+    refund_diamonds: int,
+    refund_bananas: int,
+    run,
+) -> None:
+    try:
+        position = generation_scheduler.submit(
+            GenerationJob(
+                lane=lane,
+                tg_id=message.from_user.id,
+                run=run,
+                generation_id=generation_id,
+                user_id=user_id,
+                refund_diamonds=refund_diamonds,
+                refund_bananas=refund_bananas,
+            )
+        )
+    except QueueFullError:
+        await fail_and_refund_generations(
+            session, [(generation_id, user_id, refund_diamonds, refund_bananas)], error="queue is full"
+        )
+        await message.answer("❌ Сервис перегружен, попробуйте позже. Генерации возвращены.")
+        return
+    if position > generation_scheduler.free_slots(lane):
+        await message.answer(f"⏳ Запрос в очереди, позиция: {position}")
+
+
+async def handle_text_prompt(message: types.Message, session: AsyncSession, user: Optional[User]) -> None:
     if not message.text or message.text.startswith("/") or _is_menu_text(message.text):
         return
-    user = await get_user_by_tg_id(session, message.from_user.id)
     if not user:
         await message.answer("Сначала отправьте /start")
         return
@@ -112,70 +101,135 @@ async def handle_text_prompt(message: types.Message, session: AsyncSession) -> N
         await message.answer("Недостаточно генераций. Пополните баланс.")
         return
 
-    cost_diamonds, cost_bananas = cost
-    user.diamonds -= cost_diamonds
-    user.bananas -= cost_bananas
-    await session.commit()
+    cache_key = None
+    if user.result_cache_enabled:
+        cache_key = text2img_cache_key(
+            message.text,
+            nanobanana_client.resolve_model(model),
+            nanobanana_client.image_config,
+        )
+        cached_file_id = await _send_cached_photo(message, text2img_cache, cache_key)
+        if cached_file_id:
+            # Nothing was generated, so a cache hit is not charged.
+            await create_cached_generation(
+                session,
+                user.id,
+                kind="text2img",
+                model=model,
+                prompt=message.text,
+                preset=None,
+                result_url=cached_file_id,
+            )
+            return
 
-    await create_transaction(
+    cost_diamonds, cost_bananas = cost
+    generation_id = await debit_and_create_generation(
         session,
-        user_id=user.id,
-        tx_type="spend",
+        user.id,
+        cost_diamonds=cost_diamonds,
+        cost_bananas=cost_bananas,
         method=model,
-        status="paid",
-        amount_diamonds=cost_diamonds,
-        amount_bananas=cost_bananas,
         payload={"prompt": message.text},
-    )
-
-    generation = await create_generation(
-        session,
-        user_id=user.id,
         kind="text2img",
         model=model,
         prompt=message.text,
         preset=None,
-        cost_diamonds=cost_diamonds,
-        cost_bananas=cost_bananas,
     )
+    if generation_id is None:
+        await message.answer("Недостаточно генераций. Пополните баланс.")
+        return
+
+    await _enqueue_generation(
+        message,
+        session,
+        lane=generation_scheduler.lane_for(model),
+        generation_id=generation_id,
+        user_id=user.id,
+        refund_diamonds=cost_diamonds,
+        refund_bananas=cost_bananas,
+        run=partial(
+            _run_text2img,
+            message=message,
+            generation_id=generation_id,
+            user_id=user.id,
+            model=model,
+            cost_diamonds=cost_diamonds,
+            cost_bananas=cost_bananas,
+            cache_key=cache_key,
+        ),
+    )
+
 
-    progress_message = None
-    stop_event = None
-    progress_task = None
+async def _send_cached_photo(message: types.Message, cache, cache_key: str) -> Optional[str]:
+    """Resend a cached result; returns its file_id, or ``None`` on a miss or a stale file_id."""
+    cached_file_id = await cache.get(cache_key)
+    if not cached_file_id:
+        return None
+    try:
+        await outbound.send(
+            message.chat.id,
+            partial(message.answer_photo, cached_file_id, caption="Готово ✅"),
+            PRIORITY_RESULT,
+        )
+    except Exception:  # noqa: BLE001
+        await cache.delete(cache_key)
+        return None
+    return cached_file_id
+
+
+async def _run_text2img(
+    session: AsyncSession,
+    *,
+    message: types.Message,
+    generation_id: int,
+    user_id: int,
+    model: str,
+    cost_diamonds: int,
+    cost_bananas: int,
+    cache_key: Optional[str] = None,
+) -> None:
+    progress = None
 
     try:
-        progress_message, stop_event, progress_task = await _start_progress_message(
+        progress = await progress_ticker.start(
             message,
             prefix="Генерирую изображение",
             total_seconds=_estimate_processing_time(model),
         )
-        image_bytes = await nanobanana_client.generate_text2img(message.text, model)
-        input_file = types.InputFile(BytesIO(image_bytes), filename="nanobanana.png")
-        sent = await message.answer_photo(input_file, caption="Готово ✅")
+        image = await nanobanana_client.generate_text2img(message.text, model)
+        with image:
+            sent = await outbound.send(
+                message.chat.id,
+                lambda: message.answer_photo(image.as_input_file("nanobanana.png"), caption="Готово ✅"),
+                PRIORITY_RESULT,
+            )
         result_file_id = sent.photo[-1].file_id if sent.photo else None
-        await update_generation_status(session, generation.id, "completed", result_url=result_file_id)
-        await _finish_progress_message(progress_message, stop_event, progress_task, "Изображение готово ✅")
+        await update_generation_status(session, generation_id, "completed", result_url=result_file_id)
+        if cache_key and result_file_id:
+            await text2img_cache.set(cache_key, result_file_id)
+        await progress_ticker.finish(progress, "Изображение готово ✅")
     except Exception as exc:  # noqa: BLE001
-        await _finish_progress_message(
-            progress_message,
-            stop_event,
-            progress_task,
+        await progress_ticker.finish(
+            progress,
             f"Не удалось создать изображение: {exc}",
         )
-        await update_generation_status(session, generation.id, "failed", error=str(exc))
-        await adjust_balances(session, user.id, diamonds_delta=cost_diamonds, bananas_delta=cost_bananas)
-        await message.answer(f"❌ Не удалось создать изображение. Причина: {exc}")
+        await fail_and_refund_generations(
+            session, [(generation_id, user_id, cost_diamonds, cost_bananas)], error=str(exc)
+        )
+        await outbound.send(
+            message.chat.id,
+            partial(message.answer, f"❌ Не удалось создать изображение. Причина: {exc}"),
+            PRIORITY_NOTICE,
+        )
 
 
 async def _start_animate(
-    user_id: int,
+    user: Optional[User],
     reply_to: types.Message,
     state: FSMContext,
-    session: AsyncSession,
     *,
     edit_message: bool = False,
 ) -> None:
-    user = await get_user_by_tg_id(session, user_id)
     if not user:
         if edit_message:
             await reply_to.edit_text("Сначала отправьте /start")
@@ -195,20 +249,24 @@ async def _start_animate(
         await reply_to.answer("Отправьте фото для оживления 📎")
 
 
-async def start_animate(message: types.Message, state: FSMContext, session: AsyncSession) -> None:
-    await _start_animate(message.from_user.id, message, state, session)
+async def start_animate(message: types.Message, state: FSMContext, user: Optional[User]) -> None:
+    await _start_animate(user, message, state)
 
 
 async def start_animate_callback(
     query: types.CallbackQuery,
     state: FSMContext,
-    session: AsyncSession,
+    user: Optional[User],
 ) -> None:
-    await _start_animate(query.from_user.id, query.message, state, session, edit_message=True)
+    await _start_animate(user, query.message, state, edit_message=True)
 
 
-async def process_animate_photo(message: types.Message, state: FSMContext, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, message.from_user.id)
+async def process_animate_photo(
+    message: types.Message,
+    state: FSMContext,
+    session: AsyncSession,
+    user: Optional[User],
+) -> None:
     if not user:
         await message.answer("Сначала отправьте /start")
         await state.finish()
@@ -218,71 +276,104 @@ async def process_animate_photo(message: types.Message, state: FSMContext, sessi
         await state.finish()
         return
 
-    user.diamonds -= settings.animate_cost
-    await session.commit()
-
-    await create_transaction(
+    generation_id = await debit_and_create_generation(
         session,
-        user_id=user.id,
-        tx_type="spend",
+        user.id,
+        cost_diamonds=settings.animate_cost,
+        cost_bananas=0,
         method="animate",
-        status="paid",
-        amount_diamonds=settings.animate_cost,
         payload={"file_id": message.photo[-1].file_id},
-    )
-
-    generation = await create_generation(
-        session,
-        user_id=user.id,
         kind="animate",
         model=None,
         prompt=None,
         preset=None,
-        cost_diamonds=settings.animate_cost,
-        cost_bananas=0,
     )
-
+    await state.finish()
+    if generation_id is None:
+        await message.answer("Недостаточно кристаллов для оживления! Пополните баланс.")
+        return
+    max_side = target_side("animate")
+    photo = pick_photo_size(message.photo, max_side)
     warnings_text = "\n".join(ANIMATE_WARNINGS)
     await message.answer(f"Процесс обработки запущен ✅\n\n{warnings_text}")
 
-    progress_message = None
-    stop_event = None
-    progress_task = None
-    progress_message, stop_event, progress_task = await _start_progress_message(
+    await _enqueue_generation(
+        message,
+        session,
+        lane="animate",
+        generation_id=generation_id,
+        user_id=user.id,
+        refund_diamonds=settings.animate_cost,
+        refund_bananas=0,
+        run=partial(
+            _run_animate,
+            message=message,
+            generation_id=generation_id,
+            user_id=user.id,
+            file_id=photo.file_id,
+            file_unique_id=photo.file_unique_id,
+            max_side=max_side,
+            source_side=max(photo.width, photo.height),
+        ),
+    )
+
+
+async def _run_animate(
+    session: AsyncSession,
+    *,
+    message: types.Message,
+    generation_id: int,
+    user_id: int,
+    file_id: str,
+    file_unique_id: str,
+    max_side: int,
+    source_side: int,
+) -> None:
+    progress = await progress_ticker.start(
         message,
         prefix="Оживляю фото",
         total_seconds=_estimate_processing_time(None),
+        chat_action="upload_video",
     )
 
     try:
-        video_bytes = await nanobanana_client.animate_photo(message.bot, message.photo[-1].file_id)
-        input_file = types.InputFile(BytesIO(video_bytes), filename="nanobanana.mp4")
-        sent = await message.answer_video(input_file, caption="Видео готово ✅")
+        video = await nanobanana_client.animate_photo(
+            message.bot,
+            file_id,
+            file_unique_id=file_unique_id,
+            max_side=max_side,
+            source_side=source_side,
+        )
+        with video:
+            sent = await outbound.send(
+                message.chat.id,
+                lambda: message.answer_video(video.as_input_file("nanobanana.mp4"), caption="Видео готово ✅"),
+                PRIORITY_RESULT,
+            )
         result_file_id = sent.video.file_id if sent.video else None
-        await update_generation_status(session, generation.id, "completed", result_url=result_file_id)
-        await _finish_progress_message(progress_message, stop_event, progress_task, "Видео готово ✅")
+        await update_generation_status(session, generation_id, "completed", result_url=result_file_id)
+        await progress_ticker.finish(progress, "Видео готово ✅")
     except Exception as exc:  # noqa: BLE001
-        await _finish_progress_message(
-            progress_message,
-            stop_event,
-            progress_task,
+        await progress_ticker.finish(
+            progress,
             f"Не удалось создать видео: {exc}",
         )
-        await update_generation_status(session, generation.id, "failed", error=str(exc))
-        await adjust_balances(session, user.id, diamonds_delta=settings.animate_cost)
-        await message.answer(
-            f"❌ Не удалось создать видео.\nПричина: {exc}\n💎 Кристаллы возвращены."
+        await fail_and_refund_generations(
+            session, [(generation_id, user_id, settings.animate_cost, 0)], error=str(exc)
+        )
+        await outbound.send(
+            message.chat.id,
+            partial(message.answer, f"❌ Не удалось создать видео.\nПричина: {exc}\n💎 Кристаллы возвращены."),
+            PRIORITY_NOTICE,
         )
-    finally:
-        await state.finish()
 
 
 async def process_preset_photo(
     message: types.Message,
     session: AsyncSession,
+    user: Optional[User],
     state: Optional[FSMContext] = None,
 ) -> None:
-    user = await get_user_by_tg_id(session, message.from_user.id)
     if not user or not user.selected_preset:
         await message.answer(f"Выберите пресет через \"{BTN_PRESETS}\".")
         if state:
@@ -297,73 +388,140 @@ async def process_preset_photo(
             await state.finish()
         return
 
-    cost_diamonds, cost_bananas = cost
-    user.diamonds -= cost_diamonds
-    user.bananas -= cost_bananas
-    await session.commit()
+    cache_key = None
+    preset = get_preset(user.selected_preset)
+    if user.result_cache_enabled and preset:
+        cache_key = preset_cache_key(
+            message.photo[-1].file_unique_id,
+            preset.key,
+            preset.prompt,
+            nanobanana_client.resolve_model(model),
+        )
+        cached_file_id = await _send_cached_photo(message, preset_cache, cache_key)
+        if cached_file_id:
+            if state:
+                await state.finish()
+            await create_cached_generation(
+                session,
+                user.id,
+                kind="preset_img2img",
+                model=model,
+                prompt=None,
+                preset=user.selected_preset,
+                result_url=cached_file_id,
+            )
+            return
 
-    await create_transaction(
+    cost_diamonds, cost_bananas = cost
+    generation_id = await debit_and_create_generation(
         session,
-        user_id=user.id,
-        tx_type="spend",
+        user.id,
+        cost_diamonds=cost_diamonds,
+        cost_bananas=cost_bananas,
         method=f"preset_{model}",
-        status="paid",
-        amount_diamonds=cost_diamonds,
-        amount_bananas=cost_bananas,
         payload={"preset": user.selected_preset},
-    )
-
-    generation = await create_generation(
-        session,
-        user_id=user.id,
         kind="preset_img2img",
         model=model,
         prompt=None,
         preset=user.selected_preset,
-        cost_diamonds=cost_diamonds,
-        cost_bananas=cost_bananas,
+    )
+    if state:
+        await state.finish()
+    if generation_id is None:
+        await message.answer("Недостаточно генераций. Пополните баланс.")
+        return
+
+    max_side = target_side(generation_scheduler.lane_for(model), preset)
+    photo = pick_photo_size(message.photo, max_side)
+
+    await _enqueue_generation(
+        message,
+        session,
+        lane=generation_scheduler.lane_for(model),
+        generation_id=generation_id,
+        user_id=user.id,
+        refund_diamonds=cost_diamonds,
+        refund_bananas=cost_bananas,
+        run=partial(
+            _run_preset,
+            message=message,
+            generation_id=generation_id,
+            user_id=user.id,
+            file_id=photo.file_id,
+            file_unique_id=photo.file_unique_id,
+            max_side=max_side,
+            source_side=max(photo.width, photo.height),
+            preset=user.selected_preset,
+            model=model,
+            cost_diamonds=cost_diamonds,
+            cost_bananas=cost_bananas,
+            cache_key=cache_key,
+        ),
     )
 
-    progress_message = None
-    stop_event = None
-    progress_task = None
+
+async def _run_preset(
+    session: AsyncSession,
+    *,
+    message: types.Message,
+    generation_id: int,
+    user_id: int,
+    file_id: str,
+    file_unique_id: str,
+    max_side: int,
+    source_side: int,
+    preset: str,
+    model: str,
+    cost_diamonds: int,
+    cost_bananas: int,
+    cache_key: Optional[str] = None,
+) -> None:
+    progress = None
 
     try:
-        progress_message, stop_event, progress_task = await _start_progress_message(
+        progress = await progress_ticker.start(
             message,
             prefix="Обрабатываю фото",
             total_seconds=_estimate_processing_time(model),
         )
-        image_bytes = await nanobanana_client.generate_img2img(
+        image = await nanobanana_client.generate_img2img(
             message.bot,
-            message.photo[-1].file_id,
-            user.selected_preset,
+            file_id,
+            preset,
             model,
+            file_unique_id=file_unique_id,
+            max_side=max_side,
+            source_side=source_side,
         )
-        input_file = types.InputFile(BytesIO(image_bytes), filename="nanobanana.png")
-        sent = await message.answer_photo(input_file, caption="Готово ✅")
+        with image:
+            sent = await outbound.send(
+                message.chat.id,
+                lambda: message.answer_photo(image.as_input_file("nanobanana.png"), caption="Готово ✅"),
+                PRIORITY_RESULT,
+            )
         result_file_id = sent.photo[-1].file_id if sent.photo else None
-        await update_generation_status(session, generation.id, "completed", result_url=result_file_id)
-        await _finish_progress_message(progress_message, stop_event, progress_task, "Фото готово ✅")
+        await update_generation_status(session, generation_id, "completed", result_url=result_file_id)
+        if cache_key and result_file_id:
+            await preset_cache.set(cache_key, result_file_id)
+        await progress_ticker.finish(progress, "Фото готово ✅")
     except Exception as exc:  # noqa: BLE001
-        await _finish_progress_message(
-            progress_message,
-            stop_event,
-            progress_task,
+        await progress_ticker.finish(
+            progress,
             f"Не удалось обработать фото: {exc}",
         )
-        await update_generation_status(session, generation.id, "failed", error=str(exc))
-        await adjust_balances(session, user.id, diamonds_delta=cost_diamonds, bananas_delta=cost_bananas)
-        await message.answer(f"❌ Не удалось создать изображение. Причина: {exc}")
-    finally:
-        if state:
-            await state.finish()
+        await fail_and_refund_generations(
+            session, [(generation_id, user_id, cost_diamonds, cost_bananas)], error=str(exc)
+        )
+        await outbound.send(
+            message.chat.id,
+            partial(message.answer, f"❌ Не удалось создать изображение. Причина: {exc}"),
+            PRIORITY_NOTICE,
+        )
 
 
-async def process_generic_photo(message: types.Message, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, message.from_user.id)
+async def process_generic_photo(message: types.Message, session: AsyncSession, user: Optional[User]) -> None:
     if user and user.selected_preset:
-        await process_preset_photo(message, session=session)
+        await process_preset_photo(message, session=session, user=user)
         return
     await message.answer(f"Выберите \"{BTN_ANIMATE}\" или \"{BTN_PRESETS}\" для фото.")
 
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import Optional, Tuple
+
+from aiogram import types
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db.history_cache import history_cache
+from db.models import User
+from db.repositories import get_generation_result, get_generations_page, get_generations_page_from_replica
+from keyboards.main import history_kb
+from services.outbound import PRIORITY_RESULT, outbound
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode_cursor(row) -> str:
+    # Exact microseconds keep the keyset cursor lossless inside callback_data.
+    return f"{(row.created_at - _EPOCH) // timedelta(microseconds=1)}:{row.id}"
+
+
+def _decode_cursor(raw: str) -> Tuple[datetime, int]:
+    micros, generation_id = raw.split(":", 1)
+    return _EPOCH + timedelta(microseconds=int(micros)), int(generation_id)
+
+
+async def _load_page(session: AsyncSession, user_id: int, direction: str, cursor: Optional[str]):
+    # Only the first page is cached, and it is read from the primary: a lagging replica could
+    # store the page from before a completion right after that completion invalidated the cache.
+    first = direction == "first"
+    if first:
+        page = history_cache.get(user_id, direction)
+        if page is not None:
+            return page
+    position = _decode_cursor(cursor) if cursor else None
+    load = get_generations_page if first else get_generations_page_from_replica
+    rows, has_more = await load(
+        session,
+        user_id,
+        before=position if direction == "older" else None,
+        after=position if direction == "newer" else None,
+        limit=settings.history_page_size,
+    )
+    if direction == "newer":
+        has_newer, has_older = has_more, True
+    else:
+        has_newer, has_older = direction == "older", has_more
+    newer_cursor = _encode_cursor(rows[0]) if rows and has_newer else None
+    older_cursor = _encode_cursor(rows[-1]) if rows and has_older else None
+    page = (rows, newer_cursor, older_cursor)
+    if first:
+        history_cache.set(user_id, direction, page)
+    return page
+
+
+async def _resend(query: types.CallbackQuery, session: AsyncSession, user: User, generation_id: int) -> None:
+    result = await get_generation_result(session, user.id, generation_id)
+    if result is None or not result.result_url:
+        await query.answer("Результат недоступен", show_alert=True)
+        return
+    message = query.message
+    send = message.answer_video if result.kind == "animate" else message.answer_photo
+    await query.answer()
+    await outbound.send(message.chat.id, partial(send, result.result_url), PRIORITY_RESULT)
+
+
+async def history_callback(query: types.CallbackQuery, session: AsyncSession, user: Optional[User]) -> None:
+    if not user:
+        await query.answer("Сначала /start", show_alert=True)
+        return
+    _, action, *rest = query.data.split(":", 2)
+    if action == "send":
+        await _resend(query, session, user, int(rest[0]))
+        return
+
+    direction = action if action in {"older", "newer"} else "first"
+    cursor = rest[0] if rest and direction != "first" else None
+    rows, newer_cursor, older_cursor = await _load_page(session, user.id, direction, cursor)
+    if not rows and direction == "first":
+        await query.answer("Пока нет готовых генераций", show_alert=True)
+        return
+    await query.message.edit_text(
+        "🖼 Мои генерации — нажмите, чтобы получить результат ещё раз:",
+        reply_markup=history_kb(rows, newer_cursor, older_cursor),
+    )
+    await query.answer()
+
+
+def register(dp):
+    dp.register_callback_query_handler(history_callback, lambda c: c.data and c.data.startswith("hist:"))
@@ -1,26 +1,27 @@
+from typing import Optional
+
 from aiogram import types
 from aiogram.dispatcher import FSMContext
 from aiogram.types import ParseMode
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from db.repositories import get_referrals_count, get_user_by_tg_id
+from db.models import User
+from db.repositories import set_user_result_cache
 from handlers.generation import start_animate_callback
 from handlers.common import send_main_menu
 from keyboards.main import link_inline_kb, model_select_kb, presets_kb, profile_menu_kb, topup_method_kb
 from utils.helpers import format_profile, make_ref_link
 
 
-async def show_model_select(query: types.CallbackQuery, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, query.from_user.id)
+async def show_model_select(query: types.CallbackQuery, user: Optional[User]) -> None:
     if not user:
         await query.message.edit_text("Сначала отправьте /start")
         return
     await query.message.edit_text("Выберите модель:", reply_markup=model_select_kb(user.selected_model))
 
 
-async def show_presets(query: types.CallbackQuery, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, query.from_user.id)
+async def show_presets(query: types.CallbackQuery, user: Optional[User]) -> None:
     if not user:
         await query.message.edit_text("Сначала отправьте /start")
         return
@@ -40,20 +41,26 @@ async def show_support(query: types.CallbackQuery) -> None:
     )
 
 
-async def show_profile(query: types.CallbackQuery, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, query.from_user.id)
+async def show_profile(query: types.CallbackQuery, user: Optional[User]) -> None:
     if not user:
         await query.message.edit_text("Сначала отправьте /start")
         return
 
-    referrals_count = await get_referrals_count(session, user.id)
     available_tokens = user.diamonds + user.bananas
-    text = format_profile(user, referrals_count, available_tokens)
-    await query.message.edit_text(text, reply_markup=profile_menu_kb())
+    text = format_profile(user, user.referrals_count, available_tokens)
+    await query.message.edit_text(text, reply_markup=profile_menu_kb(user.result_cache_enabled))
+
+
+async def toggle_result_cache(query: types.CallbackQuery, session: AsyncSession, user: Optional[User]) -> None:
+    if not user:
+        await query.message.edit_text("Сначала отправьте /start")
+        return
+    user.result_cache_enabled = not user.result_cache_enabled
+    await set_user_result_cache(session, user.id, user.result_cache_enabled)
+    await query.message.edit_reply_markup(reply_markup=profile_menu_kb(user.result_cache_enabled))
 
 
-async def show_referral(query: types.CallbackQuery, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, query.from_user.id)
+async def show_referral(query: types.CallbackQuery, user: Optional[User]) -> None:
     if not user:
         await query.message.edit_text("Сначала отправьте /start")
         return
@@ -71,32 +78,38 @@ async def show_referral(query: types.CallbackQuery, session: AsyncSession) -> No
     )
 
 
-async def back_to_main(query: types.CallbackQuery, session: AsyncSession) -> None:
-    user = await get_user_by_tg_id(session, query.from_user.id)
+async def back_to_main(query: types.CallbackQuery, user: Optional[User]) -> None:
     if not user:
         await query.message.edit_text("Сначала отправьте /start")
         return
     await send_main_menu(query.message, user, edit=True)
 
 
-async def menu_callback(query: types.CallbackQuery, session: AsyncSession, state: FSMContext) -> None:
+async def menu_callback(
+    query: types.CallbackQuery,
+    session: AsyncSession,
+    state: FSMContext,
+    user: Optional[User],
+) -> None:
     action = query.data.split(":", 1)[1]
     if action == "model":
-        await show_model_select(query, session)
+        await show_model_select(query, user)
     elif action == "animate":
-        await start_animate_callback(query, state, session)
+        await start_animate_callback(query, state, user)
     elif action == "presets":
-        await show_presets(query, session)
+        await show_presets(query, user)
     elif action == "topup":
         await show_topup(query)
     elif action == "support":
         await show_support(query)
     elif action == "profile":
-        await show_profile(query, session)
+        await show_profile(query, user)
     elif action == "referral":
-        await show_referral(query, session)
+        await show_referral(query, user)
+    elif action == "cache":
+        await toggle_result_cache(query, session, user)
     elif action == "back":
-        await back_to_main(query, session)
+        await back_to_main(query, user)
     await query.answer()
 
 
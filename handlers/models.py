@@ -1,16 +1,18 @@
+from typing import Optional
+
 from aiogram import types
 from aiogram.dispatcher.filters import Text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from handlers.common import send_main_menu
-from db.repositories import get_user_by_tg_id, set_user_model
+from db.models import User
+from db.repositories import set_user_model
 from keyboards.main import model_select_kb
 from utils.constants import MODEL_NAMES
 
 
-async def model_callback(query: types.CallbackQuery, session: AsyncSession) -> None:
+async def model_callback(query: types.CallbackQuery, session: AsyncSession, user: Optional[User]) -> None:
     data = query.data.split(":", 1)[1]
-    user = await get_user_by_tg_id(session, query.from_user.id)
     if not user:
         await query.answer("Сначала /start", show_alert=True)
         return
@@ -25,6 +27,7 @@ async def model_callback(query: types.CallbackQuery, session: AsyncSession) -> N
         return
 
     await set_user_model(session, user.id, data)
+    user.selected_model = data
     await query.message.edit_reply_markup(reply_markup=model_select_kb(data))
     await query.answer(f"Выбрана модель {MODEL_NAMES[data]}")
     await send_main_menu(query.message, user, edit=True)
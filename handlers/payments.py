@@ -1,4 +1,6 @@
 import uuid
+from functools import partial
+from typing import Optional
 
 from aiogram import types
 from aiogram.dispatcher.filters import Text
@@ -6,10 +8,12 @@ from aiogram.types import ContentType
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
-from db.repositories import confirm_topup, create_transaction, get_user_by_tg_id
+from db.models import User
+from db.repositories import confirm_topup, create_transaction
 from handlers.common import send_main_menu
 from keyboards.main import card_packages_kb, stars_packages_kb, topup_method_kb
 from services.payments.card import CardPaymentService
+from services.outbound import PRIORITY_NOTICE, outbound
 from services.payments.stars import StarsPaymentService
 from utils.pricing import get_card_package, get_stars_package
 
@@ -18,7 +22,7 @@ card_service = CardPaymentService()
 stars_service = StarsPaymentService()
 
 
-async def topup_callback(query: types.CallbackQuery, session: AsyncSession) -> None:
+async def topup_callback(query: types.CallbackQuery, user: Optional[User]) -> None:
     action = query.data.split(":", 1)[1]
     if action == "card":
         await query.message.edit_text("Выберите пакет Card RUB:")
@@ -31,7 +35,6 @@ async def topup_callback(query: types.CallbackQuery, session: AsyncSession) -> N
         await query.answer()
         return
     if action == "back":
-        user = await get_user_by_tg_id(session, query.from_user.id)
         if user:
             await send_main_menu(query.message, user, edit=True)
         else:
@@ -39,7 +42,7 @@ async def topup_callback(query: types.CallbackQuery, session: AsyncSession) -> N
         await query.answer()
 
 
-async def card_callback(query: types.CallbackQuery, session: AsyncSession) -> None:
+async def card_callback(query: types.CallbackQuery, session: AsyncSession, user: Optional[User]) -> None:
     code = query.data.split(":", 1)[1]
     if code == "back":
         await query.message.edit_text("Выберите способ оплаты:")
@@ -51,7 +54,6 @@ async def card_callback(query: types.CallbackQuery, session: AsyncSession) -> No
         await query.answer("Пакет не найден", show_alert=True)
         return
 
-    user = await get_user_by_tg_id(session, query.from_user.id)
     if not user:
         await query.answer("Сначала /start", show_alert=True)
         return
@@ -78,7 +80,7 @@ async def card_callback(query: types.CallbackQuery, session: AsyncSession) -> No
     await query.answer("Ссылка отправлена")
 
 
-async def stars_callback(query: types.CallbackQuery, session: AsyncSession) -> None:
+async def stars_callback(query: types.CallbackQuery, session: AsyncSession, user: Optional[User]) -> None:
     code = query.data.split(":", 1)[1]
     if code == "back":
         await query.message.edit_text("Выберите способ оплаты:")
@@ -90,7 +92,6 @@ async def stars_callback(query: types.CallbackQuery, session: AsyncSession) -> N
         await query.answer("Пакет не найден", show_alert=True)
         return
 
-    user = await get_user_by_tg_id(session, query.from_user.id)
     if not user:
         await query.answer("Сначала /start", show_alert=True)
         return
@@ -107,12 +108,17 @@ async def stars_callback(query: types.CallbackQuery, session: AsyncSession) -> N
         payload={"package": pkg.code, "stars": pkg.stars},
     )
 
-    await stars_service.send_invoice(
-        bot=query.bot,
-        chat_id=query.message.chat.id,
-        package=pkg,
-        payload=order_id,
-        provider_token=settings.stars_provider_token,
+    await outbound.send(
+        query.message.chat.id,
+        partial(
+            stars_service.send_invoice,
+            bot=query.bot,
+            chat_id=query.message.chat.id,
+            package=pkg,
+            payload=order_id,
+            provider_token=settings.stars_provider_token,
+        ),
+        PRIORITY_NOTICE,
     )
     await query.message.edit_text("Счёт в Telegram Stars отправлен. Оплатите его в чате.")
     await query.message.edit_reply_markup(reply_markup=None)
@@ -1,18 +1,25 @@
+from typing import Optional
+
 from aiogram import types
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from handlers.common import send_main_menu
-from db.repositories import get_user_by_tg_id, set_user_preset
+from db.models import User
+from db.repositories import set_user_preset
 from keyboards.main import presets_kb
 from utils.presets import get_preset
 from utils.states import GenerationStates
 
 
-async def preset_callback(query: types.CallbackQuery, state: FSMContext, session: AsyncSession) -> None:
+async def preset_callback(
+    query: types.CallbackQuery,
+    state: FSMContext,
+    session: AsyncSession,
+    user: Optional[User],
+) -> None:
     data = query.data.split(":", 1)[1]
-    user = await get_user_by_tg_id(session, query.from_user.id)
     if not user:
         await query.answer("Сначала /start", show_alert=True)
         return
@@ -24,6 +31,7 @@ async def preset_callback(query: types.CallbackQuery, state: FSMContext, session
 
     if data == "reset":
         await set_user_preset(session, user.id, None)
+        user.selected_preset = None
         await state.finish()
         await query.answer("Пресет сброшен", show_alert=False)
         await query.message.edit_reply_markup(reply_markup=presets_kb(None))
@@ -35,6 +43,7 @@ async def preset_callback(query: types.CallbackQuery, state: FSMContext, session
         return
 
     await set_user_preset(session, user.id, preset.key)
+    user.selected_preset = preset.key
     await state.set_state(GenerationStates.waiting_photo_preset.state)
     await query.message.edit_reply_markup(reply_markup=presets_kb(preset.key))
     await query.answer("Пресет выбран")
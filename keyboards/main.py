@@ -1,9 +1,14 @@
+from typing import Optional
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from utils.constants import (
     BTN_ANIMATE,
     BTN_BACK,
     BTN_BUY_TOKENS,
+    BTN_HISTORY,
+    BTN_HISTORY_NEWER,
+    BTN_HISTORY_OLDER,
     BTN_MODEL_TEMPLATE,
     BTN_PRESETS,
     BTN_PROFILE,
@@ -11,9 +16,11 @@ from utils.constants import (
     BTN_RESET_PRESET,
     BTN_SUPPORT,
     BTN_TOPUP,
+    KIND_TITLES,
     MODEL_NAMES,
     MODEL_PRICES,
     PROFILE_MENU_BUTTONS,
+    BTN_RESULT_CACHE_TEMPLATE,
 )
 from utils.presets import list_presets
 from utils.pricing import list_card_packages, list_stars_packages
@@ -39,15 +46,40 @@ def main_menu_kb(model_key: str) -> InlineKeyboardMarkup:
     return kb
 
 
-def profile_menu_kb() -> InlineKeyboardMarkup:
+def profile_menu_kb(result_cache_enabled: bool = True) -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(row_width=2)
     kb.add(InlineKeyboardButton(text=PROFILE_MENU_BUTTONS[0], callback_data="menu:animate"))
     kb.add(InlineKeyboardButton(text=PROFILE_MENU_BUTTONS[1], callback_data="menu:topup"))
     kb.add(InlineKeyboardButton(text=PROFILE_MENU_BUTTONS[2], callback_data="menu:referral"))
+    cache_state = "вкл" if result_cache_enabled else "выкл"
+    kb.add(
+        InlineKeyboardButton(
+            text=BTN_RESULT_CACHE_TEMPLATE.format(state=cache_state),
+            callback_data="menu:cache",
+        )
+    )
+    kb.add(InlineKeyboardButton(text=BTN_HISTORY, callback_data="hist:first"))
     kb.add(InlineKeyboardButton(text=PROFILE_MENU_BUTTONS[3], callback_data="menu:back"))
     return kb
 
 
+def history_kb(items, newer_cursor: Optional[str], older_cursor: Optional[str]) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    for item in items:
+        label = item.prompt or item.preset or MODEL_NAMES.get(item.model, "")
+        text = f"{item.created_at:%d.%m %H:%M} · {KIND_TITLES.get(item.kind, item.kind)} · {label}"
+        kb.add(InlineKeyboardButton(text=text[:60], callback_data=f"hist:send:{item.id}"))
+    nav = []
+    if newer_cursor:
+        nav.append(InlineKeyboardButton(text=BTN_HISTORY_NEWER, callback_data=f"hist:newer:{newer_cursor}"))
+    if older_cursor:
+        nav.append(InlineKeyboardButton(text=BTN_HISTORY_OLDER, callback_data=f"hist:older:{older_cursor}"))
+    if nav:
+        kb.row(*nav)
+    kb.add(InlineKeyboardButton(text=BTN_BACK, callback_data="menu:profile"))
+    return kb
+
+
 def model_select_kb(selected_model: str) -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup(row_width=2)
     for key in ("nano", "pro"):
@@ -1,43 +1,170 @@
+import asyncio
 import logging
+import multiprocessing
+import signal
+from functools import partial
 
 from aiogram import Bot, Dispatcher
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.utils import executor
+from aiohttp import web
 
 from config import settings
-from db.session import create_engine, create_session_factory
+from db.migrate import migrate
+from db.partitions import action_log_partitions
+from db.referral_codes import referral_code_pool
+from db.session import create_engine, create_replica_engine, create_session_factory, pool_stats
 from handlers import register_all
+from handlers.generation import nanobanana_client
 from middlewares.db import DBSessionMiddleware
 from middlewares.action_logger import ActionLoggingMiddleware
+from middlewares.user import UserMiddleware
+from services.action_log import action_log_writer
+from services.image_prep import image_preprocessor
+from services.metrics import metrics
+from services.outbound import OutboundBot, outbound
+from services.progress import progress_ticker
+from services.result_cache import preset_cache, text2img_cache
+from services.scheduler import generation_scheduler
+from services.telegram_webhook import build_webhook_app, set_webhook
+from utils.fsm_storage import RedisFSMStorage
+from utils.redis_client import get_redis
 
 
 logging.basicConfig(level=logging.INFO)
 
 
 def _build_storage():
-    if settings.fsm_storage == "redis" and settings.redis_url:
-        try:
-            from aiogram.contrib.fsm_storage.redis import RedisStorage2
-        except ImportError:  # pragma: no cover - optional dependency
-            logging.warning("Redis storage requested but aioredis is not installed. Using memory storage.")
-            return MemoryStorage()
-        return RedisStorage2.from_url(settings.redis_url)
+    if settings.fsm_storage == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisFSMStorage(redis)
+        if settings.bot_processes > 1:
+            # Each worker would keep its own MemoryStorage, so FSM state would depend on which worker got the update.
+            raise RuntimeError("Several webhook workers need FSM_STORAGE=redis with REDIS_URL and the redis package")
+        logging.warning("Redis storage requested but Redis is unavailable. Using memory storage.")
+    elif settings.bot_processes > 1:
+        raise RuntimeError("Several webhook workers need FSM_STORAGE=redis")
     return MemoryStorage()
 
 
-def main() -> None:
+def build_dispatcher(migrate_schema: bool = True):
     storage = _build_storage()
-    bot = Bot(token=settings.bot_token, parse_mode="HTML")
+    bot = OutboundBot(token=settings.bot_token, parse_mode="HTML")
     dp = Dispatcher(bot, storage=storage)
 
     engine = create_engine()
-    session_factory = create_session_factory(engine)
-    dp.middleware.setup(DBSessionMiddleware(session_factory))
-    dp.middleware.setup(ActionLoggingMiddleware(session_factory))
+    replica_engine = create_replica_engine()
+    session_factory = create_session_factory(engine, replica_engine)
+    metrics.register("db_pool", partial(pool_stats, engine))
+    if replica_engine is not None:
+        metrics.register("db_replica_pool", partial(pool_stats, replica_engine))
+    db_middleware = DBSessionMiddleware(session_factory)
+    dp.middleware.setup(db_middleware)
+    metrics.register("db_sessions", db_middleware.stats)
+    metrics.register("outbound", outbound.stats)
+    metrics.register("text2img_cache", text2img_cache.stats)
+    metrics.register("preset_cache", preset_cache.stats)
+    metrics.register("file_cache", nanobanana_client.file_cache.stats)
+    metrics.register("action_log", action_log_writer.stats)
+    metrics.register("progress", progress_ticker.stats)
+    dp.middleware.setup(UserMiddleware())
+    dp.middleware.setup(ActionLoggingMiddleware())
 
     register_all(dp)
 
-    executor.start_polling(dp, skip_updates=True)
+    async def on_startup(_dp) -> None:
+        if migrate_schema and settings.db_migrate_on_startup:
+            await migrate()
+        await generation_scheduler.fail_stale(session_factory, settings.generation_stale_after)
+        generation_scheduler.start(session_factory)
+        action_log_writer.start(session_factory)
+        referral_code_pool.start(session_factory)
+        action_log_partitions.start(session_factory)
+        metrics.start()
+
+    async def on_shutdown(_dp) -> None:
+        await metrics.stop()
+        await generation_scheduler.stop()
+        await nanobanana_client.close()
+        await progress_ticker.stop()
+        await outbound.stop()
+        await action_log_writer.stop()
+        await referral_code_pool.stop()
+        await action_log_partitions.stop()
+        image_preprocessor.shutdown()
+        await engine.dispose()
+        if replica_engine is not None:
+            await replica_engine.dispose()
+
+    return dp, on_startup, on_shutdown
+
+
+def run_polling() -> None:
+    dp, on_startup, on_shutdown = build_dispatcher()
+
+    async def on_polling_startup(_dp) -> None:
+        # getUpdates fails while a webhook is registered, e.g. after switching back from BOT_MODE=webhook.
+        await _dp.bot.delete_webhook()
+        await on_startup(_dp)
+
+    executor.start_polling(dp, skip_updates=True, on_startup=on_polling_startup, on_shutdown=on_shutdown)
+
+
+def _serve_webhook() -> None:
+    dp, on_startup, on_shutdown = build_dispatcher(migrate_schema=False)
+    app = build_webhook_app(dp, on_startup, on_shutdown)
+    web.run_app(
+        app,
+        host=settings.webhook_host,
+        port=settings.webhook_port,
+        reuse_port=settings.webhook_workers > 1,
+        print=None,
+    )
+
+
+async def _prepare_webhook() -> None:
+    if settings.db_migrate_on_startup:
+        await migrate()
+    bot = Bot(token=settings.bot_token)
+    try:
+        await set_webhook(bot)
+    finally:
+        await bot.close()
+
+
+def run_webhook() -> None:
+    if not settings.webhook_url or not settings.webhook_secret:
+        raise RuntimeError("Webhook mode needs WEBHOOK_URL and WEBHOOK_SECRET")
+    if settings.webhook_workers > 1:
+        # Fail before spawning anything if the workers could not share FSM state.
+        _build_storage()
+    asyncio.run(_prepare_webhook())
+    if settings.webhook_workers <= 1:
+        _serve_webhook()
+        return
+    # The workers share the port through SO_REUSEPORT; the kernel spreads connections between them.
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_serve_webhook, name=f"webhook-{index}") for index in range(settings.webhook_workers)]
+    for worker in workers:
+        worker.start()
+
+    def stop_workers(*_args) -> None:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    for worker in workers:
+        worker.join()
+
+
+def main() -> None:
+    if settings.bot_mode == "webhook":
+        run_webhook()
+    else:
+        run_polling()
 
 
 if __name__ == "__main__":
@@ -1,39 +1,68 @@
+import logging
+
 from aiogram.dispatcher.middlewares import BaseMiddleware
 
+from db.session import LazySession
+
+
+logger = logging.getLogger(__name__)
+
 
 class DBSessionMiddleware(BaseMiddleware):
+    """Gives each update a ``LazySession``; a real session is opened only if a handler uses it."""
+
     def __init__(self, session_factory):
         super().__init__()
         self.session_factory = session_factory
+        self.updates = 0
+        self.sessions = 0
+        self.statements = 0
 
     async def on_pre_process_message(self, message, data):
-        data["session"] = self.session_factory()
+        self._open(data)
 
     async def on_post_process_message(self, message, results, data):
-        session = data.get("session")
-        if session:
-            await session.close()
+        await self._close(data)
 
     async def on_pre_process_callback_query(self, callback_query, data):
-        data["session"] = self.session_factory()
+        self._open(data)
 
     async def on_post_process_callback_query(self, callback_query, results, data):
-        session = data.get("session")
-        if session:
-            await session.close()
+        await self._close(data)
 
     async def on_pre_process_pre_checkout_query(self, pre_checkout_query, data):
-        data["session"] = self.session_factory()
+        self._open(data)
 
     async def on_post_process_pre_checkout_query(self, pre_checkout_query, results, data):
-        session = data.get("session")
-        if session:
-            await session.close()
+        await self._close(data)
 
     async def on_pre_process_successful_payment(self, message, data):
-        data["session"] = self.session_factory()
+        self._open(data)
 
     async def on_post_process_successful_payment(self, message, results, data):
+        await self._close(data)
+
+    def stats(self) -> dict:
+        return {
+            "updates": self.updates,
+            "sessions": self.sessions,
+            "statements": self.statements,
+            "statements_per_update": self.statements / self.updates if self.updates else 0.0,
+        }
+
+    def _open(self, data) -> None:
+        data["session"] = LazySession(self.session_factory)
+        # For work that outlives the update, e.g. background exports.
+        data["session_factory"] = self.session_factory
+
+    async def _close(self, data) -> None:
         session = data.get("session")
-        if session:
-            await session.close()
+        if session is None:
+            return
+        self.updates += 1
+        if not session.started:
+            return
+        self.sessions += 1
+        self.statements += session.statements
+        logger.debug("Update used %s SQL statements", session.statements)
+        await session.close()
@@ -0,0 +1,30 @@
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from db.repositories import get_user_by_tg_id
+from db.user_cache import dump_user, load_user, user_cache
+
+
+class UserMiddleware(BaseMiddleware):
+    """Resolves the sender's ``User`` once per update and passes it to handlers as ``user``.
+
+    Handlers get a detached copy: it reflects the database (or the short-TTL
+    cache) at the start of the update and is not tracked by the session.
+    """
+
+    async def on_process_message(self, message, data):
+        await self._resolve(message.from_user.id, data)
+
+    async def on_process_callback_query(self, callback_query, data):
+        await self._resolve(callback_query.from_user.id, data)
+
+    async def _resolve(self, tg_id: int, data) -> None:
+        if "user" in data:
+            return
+        user = await user_cache.get(tg_id)
+        if user is None:
+            session = data.get("session")
+            db_user = await get_user_by_tg_id(session, tg_id) if session is not None else None
+            if db_user is not None:
+                await user_cache.set(db_user)
+                user = load_user(dump_user(db_user))
+        data["user"] = user
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from config import settings
+from db.repositories import log_actions
+
+
+logger = logging.getLogger(__name__)
+
+
+class ActionLogWriter:
+    """Buffers ``action_logs`` rows and writes them in batches from one task.
+
+    ``submit`` only enqueues; a background task flushes the queue with a
+    multi-row INSERT every ``flush_interval`` seconds or as soon as
+    ``batch_size`` rows are waiting. When the queue is full, ``overflow``
+    decides whether new rows are dropped (``drop``) or the caller waits for
+    room (``block``). ``stop`` writes out everything still buffered.
+    """
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, overflow: str) -> None:
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = flush_interval
+        self._block = overflow == "block"
+        self._session_factory = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._last_drop_warning = 0.0
+
+    def start(self, session_factory) -> None:
+        if self._task is not None:
+            return
+        self._session_factory = session_factory
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # The task drains the queue and exits; cancelling it could lose a batch mid-write.
+        self._closing = True
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def submit(
+        self,
+        tg_id: int,
+        username: Optional[str],
+        action: str,
+        payload: Optional[dict] = None,
+    ) -> None:
+        entry = {
+            "tg_id": tg_id,
+            "username": username,
+            "action": action,
+            "payload": payload,
+            "created_at": datetime.now(timezone.utc),
+        }
+        if self._block:
+            await self._queue.put(entry)
+            return
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self._last_drop_warning >= 10:
+                self._last_drop_warning = now
+                logger.warning("Action log queue is full, %s entries dropped so far", self.dropped)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    def _drain(self) -> List[dict]:
+        batch = []
+        while len(batch) < self._batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            if batch:
+                await self._flush(batch)
+            elif self._closing:
+                return
+
+    async def _collect(self) -> List[dict]:
+        """Wait up to ``flush_interval`` for a full batch; return whatever arrived."""
+        if self._closing:
+            return self._drain()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._flush_interval
+        batch: List[dict] = []
+        while len(batch) < self._batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _flush(self, batch: List[dict]) -> None:
+        if not batch:
+            return
+        session = self._session_factory()
+        try:
+            await log_actions(session, batch)
+            self.written += len(batch)
+        except Exception as exc:  # noqa: BLE001
+            self.failed += len(batch)
+            logger.warning("Failed to write %s action log entries: %s", len(batch), exc)
+        finally:
+            await session.close()
+
+
+action_log_writer = ActionLogWriter(
+    queue_size=settings.action_log_queue_size,
+    batch_size=settings.action_log_batch_size,
+    flush_interval=settings.action_log_flush_interval,
+    overflow=settings.action_log_overflow,
+)
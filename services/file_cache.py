@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+
+FileData = Tuple[bytes, str]
+
+
+class FileDownloadCache:
+    """Byte-budgeted LRU of downloaded Telegram files keyed by ``file_unique_id``.
+
+    ``get_file`` path resolutions are cached separately by ``file_id``, and
+    concurrent fetches of the same key share a single download.
+    """
+
+    def __init__(self, max_bytes: int, path_ttl_seconds: int, max_paths: int = 10000) -> None:
+        self._max_bytes = max_bytes
+        self._path_ttl = path_ttl_seconds
+        self._max_paths = max_paths
+        self._entries: "OrderedDict[str, FileData]" = OrderedDict()
+        self._paths: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.path_hits = 0
+        self.path_misses = 0
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[FileData]]) -> FileData:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._store(key, value)
+        future.set_result(value)
+        return value
+
+    async def resolve_path(self, bot, file_id: str) -> str:
+        entry = self._paths.get(file_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self._paths.move_to_end(file_id)
+            self.path_hits += 1
+            return entry[1]
+        self.path_misses += 1
+        file = await bot.get_file(file_id)
+        self._paths[file_id] = (time.monotonic() + self._path_ttl, file.file_path)
+        self._paths.move_to_end(file_id)
+        while len(self._paths) > self._max_paths:
+            self._paths.popitem(last=False)
+        return file.file_path
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.shared
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "hit_rate": (self.hits + self.shared) / lookups if lookups else 0.0,
+            "path_entries": len(self._paths),
+            "path_hits": self.path_hits,
+            "path_misses": self.path_misses,
+        }
+
+    def _store(self, key: str, value: FileData) -> None:
+        size = len(value[0])
+        if size > self._max_bytes:
+            return
+        previous: Optional[FileData] = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous[0])
+        self._entries[key] = value
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted[0])
@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Optional, Sequence, Tuple
+
+from PIL import Image
+
+from config import settings
+
+
+def target_side(lane: Optional[str], preset=None) -> int:
+    if preset is not None and preset.max_side:
+        return preset.max_side
+    if lane == "animate":
+        return settings.image_target_animate
+    if lane == "pro":
+        return settings.image_target_pro
+    return settings.image_target_nano
+
+
+def pick_photo_size(photos: Sequence, side: int):
+    """Smallest PhotoSize whose longest side still covers ``side``."""
+    ordered = sorted(photos, key=lambda photo: max(photo.width, photo.height))
+    for photo in ordered:
+        if max(photo.width, photo.height) >= side:
+            return photo
+    return ordered[-1]
+
+
+def _downscale(data: bytes, max_side: int, quality: int) -> Optional[bytes]:
+    with Image.open(BytesIO(data)) as image:
+        if max(image.size) <= max_side:
+            return None
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        output = BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ImagePreprocessor:
+    def __init__(self, workers: int, quality: int) -> None:
+        self._workers = workers
+        self._quality = quality
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def prepare(self, data: bytes, mime_type: str, max_side: int) -> Tuple[bytes, str]:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        loop = asyncio.get_running_loop()
+        resized = await loop.run_in_executor(self._pool, _downscale, data, max_side, self._quality)
+        if resized is None:
+            return data, mime_type
+        return resized, "image/jpeg"
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+image_preprocessor = ImagePreprocessor(settings.image_prep_workers, settings.image_jpeg_quality)
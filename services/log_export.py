@@ -0,0 +1,182 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from config import settings
+from db.repositories import stream_action_logs
+from services.result_buffer import ResultBuffer
+
+
+FORMATS = {"csv", "jsonl"}
+# Bot API limit for documents sent by a bot.
+TELEGRAM_UPLOAD_LIMIT = 50 * 1000 * 1000
+_COLUMNS = ["id", "tg_id", "username", "action", "payload", "created_at"]
+
+
+@dataclass
+class LogExportFilters:
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    action: Optional[str] = None
+    tg_id: Optional[int] = None
+
+
+@dataclass
+class LogExportPart:
+    buffer: ResultBuffer
+    rows: int
+    filename: str
+
+
+@dataclass
+class LogExport:
+    parts: List[LogExportPart]
+    rows: int
+
+    def close(self) -> None:
+        for part in self.parts:
+            part.buffer.close()
+
+    def __enter__(self) -> "LogExport":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _encode_csv(rows, header: bool) -> bytes:
+    text = io.StringIO()
+    writer = csv.writer(text)
+    if header:
+        writer.writerow(_COLUMNS)
+    for row in rows:
+        writer.writerow(
+            [
+                row.id,
+                row.tg_id,
+                row.username or "",
+                row.action,
+                json.dumps(row.payload, ensure_ascii=False) if row.payload is not None else "",
+                row.created_at.isoformat() if row.created_at else "",
+            ]
+        )
+    return text.getvalue().encode("utf-8")
+
+
+def _encode_jsonl(rows) -> bytes:
+    lines = []
+    for row in rows:
+        item = dict(row._mapping)
+        item["created_at"] = row.created_at.isoformat() if row.created_at else None
+        lines.append(json.dumps(item, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _PartWriter:
+    """Gzip parts of at most about ``part_bytes`` each; every part is a complete file on its own."""
+
+    def __init__(self, fmt: str, part_bytes: int) -> None:
+        self._fmt = fmt
+        self._part_bytes = part_bytes
+        self._handle = None
+        self._archive = None
+        self._rows = 0
+        self.parts: List[Tuple[str, int]] = []
+
+    def write(self, rows) -> None:
+        if self._archive is None:
+            self._handle = tempfile.NamedTemporaryFile(
+                prefix="nanobanana-logs-", suffix=".gz", dir=settings.result_spill_dir, delete=False
+            )
+            self._archive = gzip.GzipFile(fileobj=self._handle, mode="wb")
+            self._rows = 0
+        first = self._rows == 0
+        self._archive.write(_encode_csv(rows, header=first) if self._fmt == "csv" else _encode_jsonl(rows))
+        self._rows += len(rows)
+        # Compressed bytes reach the file with a lag, so part_bytes leaves headroom below the upload limit.
+        if self._handle.tell() >= self._part_bytes:
+            self.finish_part()
+
+    def finish_part(self) -> None:
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._handle.close()
+        self.parts.append((self._handle.name, self._rows))
+        self._archive = self._handle = None
+        size = os.path.getsize(self.parts[-1][0])
+        if size > TELEGRAM_UPLOAD_LIMIT:
+            raise RuntimeError(
+                f"Export part is {size} bytes, over Telegram's {TELEGRAM_UPLOAD_LIMIT} byte upload limit; "
+                "lower LOG_EXPORT_PART_BYTES or LOG_EXPORT_CHUNK_SIZE"
+            )
+
+    def discard(self) -> None:
+        if self._archive is not None:
+            self._archive.close()
+            self._handle.close()
+            self.parts.append((self._handle.name, self._rows))
+            self._archive = self._handle = None
+        for path, _ in self.parts:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _part_filename(fmt: str, index: int, count: int) -> str:
+    if count == 1:
+        return f"action_logs.{fmt}.gz"
+    return f"action_logs.part{index:02d}.{fmt}.gz"
+
+
+async def export_action_logs(session_factory, filters: LogExportFilters, fmt: str = "csv") -> LogExport:
+    """Write matching action logs to gzip-compressed temp files, chunk by chunk.
+
+    Rows come from a server-side cursor in ``LOG_EXPORT_CHUNK_SIZE`` batches;
+    encoding and compression run in a thread, so memory use does not depend
+    on the number of rows and the event loop stays free. A new file starts
+    once the current one reaches ``LOG_EXPORT_PART_BYTES``, because Telegram
+    bots cannot upload documents over 50 MB.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    writer = _PartWriter(fmt, min(settings.log_export_part_bytes, TELEGRAM_UPLOAD_LIMIT))
+    rows_written = 0
+    session = session_factory()
+    try:
+        async for rows in stream_action_logs(
+            session,
+            date_from=filters.date_from,
+            date_to=filters.date_to,
+            action=filters.action,
+            tg_id=filters.tg_id,
+            chunk_size=settings.log_export_chunk_size,
+        ):
+            await asyncio.to_thread(writer.write, rows)
+            rows_written += len(rows)
+        await asyncio.to_thread(writer.finish_part)
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        await session.close()
+    count = len(writer.parts)
+    return LogExport(
+        parts=[
+            LogExportPart(
+                buffer=ResultBuffer(path=path, size=os.path.getsize(path)),
+                rows=rows,
+                filename=_part_filename(fmt, index, count),
+            )
+            for index, (path, rows) in enumerate(writer.parts, start=1)
+        ],
+        rows=rows_written,
+    )
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, Optional
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRegistry:
+    """Collects the ``stats()`` of long-lived components under one name each.
+
+    ``snapshot`` reads every source; a background task logs it every
+    ``interval`` seconds (``0`` disables logging) and the admin ``/stats``
+    command shows it on demand. A source that raises is reported as an error
+    instead of hiding the others.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self._sources: Dict[str, Callable[[], dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, source: Callable[[], dict]) -> None:
+        self._sources[name] = source
+
+    def snapshot(self) -> Dict[str, dict]:
+        result = {}
+        for name, source in self._sources.items():
+            try:
+                result[name] = source()
+            except Exception as exc:  # noqa: BLE001
+                result[name] = {"error": str(exc)}
+        return result
+
+    def render(self) -> str:
+        lines = []
+        for name, values in self.snapshot().items():
+            fields = ", ".join(f"{key}={_format(value)}" for key, value in values.items())
+            lines.append(f"{name}: {fields}")
+        return "\n".join(lines) or "Метрик нет"
+
+    def start(self) -> None:
+        if self._task is not None or self._interval <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            logger.info("Metrics: %s", json.dumps(self.snapshot(), default=str, sort_keys=True))
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+metrics = MetricsRegistry(interval=settings.metrics_log_interval)
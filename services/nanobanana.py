@@ -1,61 +1,139 @@
 import asyncio
 import mimetypes
-import time
 from typing import Optional, Tuple
 
+import httpx
 from google import genai
 from google.genai import types
 
 from config import settings
+from services.file_cache import FileDownloadCache
+from services.image_prep import image_preprocessor
+from services.result_buffer import ResultBuffer
+from services.veo_poller import VeoOperationPoller
 from utils.presets import get_preset
 
 
 class NanoBananaClient:
     _veo_model = "veo-2.0-generate-001"
+    image_config = {"response_modalities": ["IMAGE"]}
 
     def __init__(
         self,
         api_key: Optional[str] = None,
         nano_model: Optional[str] = None,
         pro_model: Optional[str] = None,
+        backend: Optional[str] = None,
     ) -> None:
         self._api_key = api_key or settings.gemini_api_key
         if not self._api_key:
             raise RuntimeError("GEMINI_API_KEY is required for NanoBanana generation.")
         self._nano_model = nano_model or settings.gemini_nano_model
         self._pro_model = pro_model or settings.gemini_pro_model
+        self._backend = backend or settings.gemini_backend
+        if self._backend not in {"aio", "thread"}:
+            raise RuntimeError(f"Unknown GEMINI_BACKEND: {self._backend}")
+        # One client for the whole process: ``client.aio`` keeps a single HTTP
+        # session, so every coroutine shares its connection pool.
         self._client = genai.Client(api_key=self._api_key)
+        self._inflight = asyncio.Semaphore(settings.per_process(settings.gemini_max_inflight))
+        self._veo_poller = VeoOperationPoller(
+            self._client,
+            initial_delay=settings.veo_poll_initial_delay,
+            max_delay=settings.veo_poll_max_delay,
+            backoff=settings.veo_poll_backoff,
+            batch_size=settings.veo_poll_batch_size,
+        )
+        self.file_cache = FileDownloadCache(
+            max_bytes=settings.file_cache_max_bytes,
+            path_ttl_seconds=settings.file_path_cache_ttl,
+        )
+        self._http: Optional[httpx.AsyncClient] = None
 
-    async def generate_text2img(self, prompt: str, model: str) -> bytes:
-        return await asyncio.to_thread(self._generate_image, prompt, model, None)
+    async def generate_text2img(self, prompt: str, model: str) -> ResultBuffer:
+        if self._backend == "aio":
+            image_bytes = await self._generate_image_async(prompt, model, None)
+        else:
+            image_bytes = await asyncio.to_thread(self._generate_image, prompt, model, None)
+        return await ResultBuffer.from_bytes(image_bytes)
 
-    async def generate_img2img(self, bot, file_id: str, preset: str, model: str) -> bytes:
-        image_bytes, mime_type = await self._download_file(bot, file_id)
+    async def generate_img2img(
+        self,
+        bot,
+        file_id: str,
+        preset: str,
+        model: str,
+        file_unique_id: Optional[str] = None,
+        max_side: Optional[int] = None,
+        source_side: Optional[int] = None,
+    ) -> ResultBuffer:
+        image_bytes, mime_type = await self._load_image(bot, file_id, file_unique_id, max_side, source_side)
         preset_obj = get_preset(preset)
         prompt = preset_obj.prompt if preset_obj else "Transform the image."
         image_part = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
-        return await asyncio.to_thread(self._generate_image, prompt, model, image_part)
+        if self._backend == "aio":
+            result_bytes = await self._generate_image_async(prompt, model, image_part)
+        else:
+            result_bytes = await asyncio.to_thread(self._generate_image, prompt, model, image_part)
+        return await ResultBuffer.from_bytes(result_bytes)
 
-    async def animate_photo(self, bot, file_id: str, preset: Optional[str] = None) -> bytes:
-        image_bytes, mime_type = await self._download_file(bot, file_id)
+    async def animate_photo(
+        self,
+        bot,
+        file_id: str,
+        preset: Optional[str] = None,
+        file_unique_id: Optional[str] = None,
+        max_side: Optional[int] = None,
+        source_side: Optional[int] = None,
+    ) -> ResultBuffer:
+        image_bytes, mime_type = await self._load_image(bot, file_id, file_unique_id, max_side, source_side)
         prompt = (
             preset
             or "generate a video where these people take glass bottles of beer, clink them and drink, laughing and discussing something in the process."
         )
-        return await asyncio.to_thread(self._generate_video_from_image, image_bytes, mime_type, prompt)
-
-    def _generate_video_from_image(self, image_bytes: bytes, mime_type: str, prompt: str) -> bytes:
-        image = types.Image(image_bytes=image_bytes, mime_type=mime_type)
-        config = types.GenerateVideosConfig()
-        operation = self._client.models.generate_videos(
-            model=self._veo_model,
-            prompt=prompt,
-            image=image,
-            config=config,
-        )
-        while not operation.done:
-            time.sleep(3)
-            operation = self._client.operations.get(operation)
+        operation = await self._start_video_operation(image_bytes, mime_type, prompt)
+        operation = await self._veo_poller.wait(operation)
+        video_resource = self._extract_video_resource(operation)
+        if video_resource.uri:
+            async with self._inflight:
+                video = await self._stream_video(video_resource.uri)
+        elif self._backend == "aio":
+            async with self._inflight:
+                video = await ResultBuffer.from_bytes(await self._client.aio.files.download(file=video_resource))
+        else:
+            video_bytes = await asyncio.to_thread(self._client.files.download, file=video_resource)
+            video = await ResultBuffer.from_bytes(video_bytes or b"")
+        if not video.size:
+            video.close()
+            raise RuntimeError("Empty video bytes received from VEO.")
+        return video
+
+    async def close(self) -> None:
+        await self._veo_poller.stop()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _stream_video(self, uri: str) -> ResultBuffer:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(60.0), follow_redirects=True)
+        async with self._http.stream("GET", uri, headers={"x-goog-api-key": self._api_key}) as response:
+            response.raise_for_status()
+            return await ResultBuffer.from_stream(response.aiter_bytes())
+
+    async def _start_video_operation(self, image_bytes: bytes, mime_type: str, prompt: str):
+        request = {
+            "model": self._veo_model,
+            "prompt": prompt,
+            "image": types.Image(image_bytes=image_bytes, mime_type=mime_type),
+            "config": types.GenerateVideosConfig(),
+        }
+        if self._backend == "aio":
+            async with self._inflight:
+                return await self._client.aio.models.generate_videos(**request)
+        return await asyncio.to_thread(self._client.models.generate_videos, **request)
+
+    def _extract_video_resource(self, operation):
         if operation.error:
             raise RuntimeError(f"Video generation failed: {operation.error.message}")
         response = operation.response
@@ -65,13 +143,21 @@ class NanoBananaClient:
         video_resource = response.generated_videos[0].video
         if not video_resource:
             raise RuntimeError("Missing video payload from VEO.")
-        video_bytes = self._client.files.download(file=video_resource)
-        if not video_bytes:
-            raise RuntimeError("Empty video bytes received from VEO.")
-        return video_bytes
+        return video_resource
 
     def _generate_image(self, prompt: str, model: str, image_part: Optional[types.Part]) -> bytes:
-        resolved_model = self._resolve_model(model)
+        response = self._client.models.generate_content(**self._build_image_request(prompt, model, image_part))
+        return self._extract_image_bytes(response)
+
+    async def _generate_image_async(self, prompt: str, model: str, image_part: Optional[types.Part]) -> bytes:
+        async with self._inflight:
+            response = await self._client.aio.models.generate_content(
+                **self._build_image_request(prompt, model, image_part)
+            )
+        return self._extract_image_bytes(response)
+
+    def _build_image_request(self, prompt: str, model: str, image_part: Optional[types.Part]) -> dict:
+        resolved_model = self.resolve_model(model)
         parts = [types.Part.from_text(text=prompt)]
         if image_part:
             parts.append(image_part)
@@ -81,17 +167,10 @@ class NanoBananaClient:
                 parts=parts,
             )
         ]
-        config = types.GenerateContentConfig(
-            response_modalities=["IMAGE"],
-        )
-        response = self._client.models.generate_content(
-            model=resolved_model,
-            contents=contents,
-            config=config,
-        )
-        return self._extract_image_bytes(response)
+        config = types.GenerateContentConfig(**self.image_config)
+        return {"model": resolved_model, "contents": contents, "config": config}
 
-    def _resolve_model(self, model: str) -> str:
+    def resolve_model(self, model: str) -> str:
         if model == "pro":
             return self._pro_model
         return self._nano_model
@@ -108,14 +187,34 @@ class NanoBananaClient:
                     return data
         raise RuntimeError("No image data returned from Gemini.")
 
-    async def _download_file(self, bot, file_id: str) -> Tuple[bytes, str]:
-        file = await bot.get_file(file_id)
-        file_obj = await bot.download_file(file.file_path)
+    async def _load_image(
+        self,
+        bot,
+        file_id: str,
+        file_unique_id: Optional[str],
+        max_side: Optional[int],
+        source_side: Optional[int],
+    ) -> Tuple[bytes, str]:
+        if not max_side or (source_side and source_side <= max_side):
+            return await self._download_file(bot, file_id, file_unique_id)
+
+        async def fetch() -> Tuple[bytes, str]:
+            data, mime_type = await self._fetch_file(bot, file_id)
+            return await image_preprocessor.prepare(data, mime_type, max_side)
+
+        return await self.file_cache.get_or_fetch(f"{file_unique_id or file_id}@{max_side}", fetch)
+
+    async def _download_file(self, bot, file_id: str, file_unique_id: Optional[str] = None) -> Tuple[bytes, str]:
+        return await self.file_cache.get_or_fetch(file_unique_id or file_id, lambda: self._fetch_file(bot, file_id))
+
+    async def _fetch_file(self, bot, file_id: str) -> Tuple[bytes, str]:
+        file_path = await self.file_cache.resolve_path(bot, file_id)
+        file_obj = await bot.download_file(file_path)
         if hasattr(file_obj, "read"):
             data = file_obj.read()
         else:
             data = file_obj
-        mime_type, _ = mimetypes.guess_type(file.file_path or "")
+        mime_type, _ = mimetypes.guess_type(file_path or "")
         if not mime_type:
             mime_type = "image/jpeg"
         return data, mime_type
@@ -0,0 +1,294 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from aiogram import Bot
+from aiogram.bot.api import Methods
+from aiogram.utils.exceptions import RetryAfter
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+PRIORITY_RESULT = 0
+PRIORITY_NOTICE = 1
+PRIORITY_PROGRESS = 2
+
+# Bot API methods that post to or change a chat; OutboundBot paces these.
+PACED_METHODS = {
+    Methods.SEND_MESSAGE,
+    Methods.SEND_PHOTO,
+    Methods.SEND_VIDEO,
+    Methods.SEND_ANIMATION,
+    Methods.SEND_DOCUMENT,
+    Methods.SEND_MEDIA_GROUP,
+    Methods.SEND_STICKER,
+    Methods.SEND_INVOICE,
+    Methods.SEND_CHAT_ACTION,
+    Methods.FORWARD_MESSAGE,
+    Methods.EDIT_MESSAGE_TEXT,
+    Methods.EDIT_MESSAGE_CAPTION,
+    Methods.EDIT_MESSAGE_MEDIA,
+    Methods.EDIT_MESSAGE_REPLY_MARKUP,
+    Methods.DELETE_MESSAGE,
+}
+
+# Set while a request runs inside OutboundSender, so its Bot API call is not queued a second time.
+_inside_outbound: ContextVar[bool] = ContextVar("inside_outbound", default=False)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+@dataclass
+class _Request:
+    priority: int
+    seq: int
+    chat_id: int
+    call: Callable[[], Awaitable]
+    future: asyncio.Future
+    enqueued_at: float
+    attempts: int = 0
+
+
+@dataclass
+class _Metrics:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+    by_priority: Dict[int, int] = field(default_factory=dict)
+
+
+class OutboundSender:
+    """Rate-limited, prioritized gateway for outgoing Bot API calls.
+
+    Requests wait for a token from both the global bucket (~30 msg/s) and
+    their chat's bucket (~1 msg/s); among ready requests the lowest priority
+    value goes first. ``RetryAfter`` pauses the chat for the requested time
+    and requeues the request.
+    """
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: float,
+        max_retries: int,
+        concurrency: int,
+    ) -> None:
+        # A bucket holding less than one token never releases a request.
+        self._global = TokenBucket(global_rate, max(global_rate, 1.0))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._chats: Dict[int, TokenBucket] = {}
+        self._queue: List[_Request] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._metrics = _Metrics()
+
+    async def send(self, chat_id: int, call: Callable[[], Awaitable], priority: int = PRIORITY_NOTICE):
+        """Schedule ``call`` (a factory returning a fresh coroutine) and await its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._push(
+            _Request(
+                priority=priority,
+                seq=next(self._seq),
+                chat_id=chat_id,
+                call=call,
+                future=future,
+                enqueued_at=time.monotonic(),
+            )
+        )
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for request in self._queue:
+            if not request.future.done():
+                request.future.cancel()
+        self._queue.clear()
+
+    def stats(self) -> dict:
+        metrics = self._metrics
+        return {
+            "queued": len(self._queue),
+            "chats": len(self._chats),
+            "sent": metrics.sent,
+            "failed": metrics.failed,
+            "retried": metrics.retried,
+            "queue_wait_avg": metrics.wait_total / metrics.sent if metrics.sent else 0.0,
+            "queue_wait_max": metrics.wait_max,
+            "latency_avg": metrics.latency_total / metrics.sent if metrics.sent else 0.0,
+            "latency_max": metrics.latency_max,
+            "sent_by_priority": dict(metrics.by_priority),
+        }
+
+    def _push(self, request: _Request) -> None:
+        self._queue.append(request)
+        self._wakeup.set()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self._chat_rate, self._chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if not self._queue:
+                self._prune_chats()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+            request, delay = self._next_ready(now)
+            if request is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._queue.remove(request)
+            self._global.take()
+            self._chat_bucket(request.chat_id).take()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._execute(request))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def _next_ready(self, now: float):
+        best: Optional[_Request] = None
+        min_delay = None
+        for request in self._queue:
+            if request.future.done():
+                continue
+            delay = self._chat_bucket(request.chat_id).delay(now)
+            if delay > 0:
+                min_delay = delay if min_delay is None else min(min_delay, delay)
+                continue
+            if best is None or (request.priority, request.seq) < (best.priority, best.seq):
+                best = request
+        if best is None:
+            self._queue = [request for request in self._queue if not request.future.done()]
+        return best, min_delay if min_delay is not None else 1.0
+
+    async def _execute(self, request: _Request) -> None:
+        _inside_outbound.set(True)
+        started = time.monotonic()
+        try:
+            result = await request.call()
+        except RetryAfter as exc:
+            request.attempts += 1
+            now = time.monotonic()
+            self._chat_bucket(request.chat_id).block(now, exc.timeout)
+            if request.attempts > self._max_retries:
+                self._fail(request, exc)
+            else:
+                self._metrics.retried += 1
+                logger.info("Telegram flood limit for chat %s, retry in %ss", request.chat_id, exc.timeout)
+                self._push(request)
+        except Exception as exc:  # noqa: BLE001
+            self._fail(request, exc)
+        else:
+            finished = time.monotonic()
+            metrics = self._metrics
+            metrics.sent += 1
+            wait = started - request.enqueued_at
+            latency = finished - started
+            metrics.wait_total += wait
+            metrics.wait_max = max(metrics.wait_max, wait)
+            metrics.latency_total += latency
+            metrics.latency_max = max(metrics.latency_max, latency)
+            metrics.by_priority[request.priority] = metrics.by_priority.get(request.priority, 0) + 1
+            if not request.future.done():
+                request.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _fail(self, request: _Request, exc: Exception) -> None:
+        self._metrics.failed += 1
+        if not request.future.done():
+            request.future.set_exception(exc)
+
+    def _prune_chats(self) -> None:
+        now = time.monotonic()
+        idle = [
+            chat_id
+            for chat_id, bucket in self._chats.items()
+            if bucket.delay(now) == 0 and bucket.tokens >= bucket.capacity
+        ]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+
+class OutboundBot(Bot):
+    """Bot whose chat-facing API calls go through ``outbound``.
+
+    Handlers keep calling ``message.answer`` and friends and still share the
+    rate limits with explicit ``outbound.send`` calls. Uploads go straight to
+    Telegram: their streams cannot be replayed on ``RetryAfter``, so handlers
+    send them through ``outbound.send`` with a factory that reopens the file.
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        chat_id = (data or {}).get("chat_id")
+        if method not in PACED_METHODS or chat_id is None or files or _inside_outbound.get():
+            return await super().request(method, data, files, **kwargs)
+        return await outbound.send(chat_id, partial(super().request, method, data, files, **kwargs))
+
+
+outbound = OutboundSender(
+    # Telegram's limits apply to the bot token, not to one webhook worker.
+    global_rate=settings.per_process(settings.outbound_global_rate),
+    chat_rate=settings.per_process(settings.outbound_chat_rate),
+    chat_burst=settings.outbound_chat_burst,
+    max_retries=settings.outbound_max_retries,
+    concurrency=settings.outbound_concurrency,
+)
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Dict, List, Optional
+
+from config import settings
+from services.outbound import PRIORITY_NOTICE, PRIORITY_PROGRESS, outbound
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProgressHandle:
+    id: int
+    message: object
+    prefix: str
+    total_seconds: int
+    chat_action: str
+    started_at: float
+    last_text: str
+    last_edit_at: float
+    last_action_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class ProgressTicker:
+    """Owns every live progress message and refreshes them from one task.
+
+    Each tick renders the remaining time (rounded to ``step_seconds``) for all
+    messages, skips the ones whose text did not change and edits the stalest
+    first within a global ``edits_per_second`` budget. Messages that miss the
+    budget get a cheap ``send_chat_action`` instead.
+    """
+
+    _chat_action_ttl = 5.0
+
+    def __init__(self, tick_seconds: float, step_seconds: int, edits_per_second: float) -> None:
+        self._tick = tick_seconds
+        self._step = max(1, step_seconds)
+        self._edits_per_tick = max(1, int(edits_per_second * tick_seconds))
+        self._handles: Dict[int, ProgressHandle] = {}
+        self._next_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self.edits = 0
+        self.skipped = 0
+        self.chat_actions = 0
+
+    @property
+    def active_count(self) -> int:
+        return len(self._handles)
+
+    async def start(
+        self,
+        message,
+        prefix: str,
+        total_seconds: int = 40,
+        chat_action: str = "upload_photo",
+    ) -> Optional[ProgressHandle]:
+        text = self._render(prefix, total_seconds)
+        try:
+            progress_message = await outbound.send(message.chat.id, partial(message.answer, text), PRIORITY_NOTICE)
+        except Exception:  # noqa: BLE001
+            return None
+        now = time.monotonic()
+        self._next_id += 1
+        handle = ProgressHandle(
+            id=self._next_id,
+            message=progress_message,
+            prefix=prefix,
+            total_seconds=total_seconds,
+            chat_action=chat_action,
+            started_at=now,
+            last_text=text,
+            last_edit_at=now,
+        )
+        self._handles[handle.id] = handle
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return handle
+
+    async def finish(self, handle: Optional[ProgressHandle], final_text: str) -> None:
+        if handle is None:
+            return
+        self._handles.pop(handle.id, None)
+        async with handle.lock:
+            try:
+                await outbound.send(
+                    handle.message.chat.id,
+                    partial(handle.message.edit_text, final_text),
+                    PRIORITY_NOTICE,
+                )
+            except Exception:  # noqa: BLE001
+                pass
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._handles.clear()
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._handles),
+            "edits": self.edits,
+            "skipped": self.skipped,
+            "chat_actions": self.chat_actions,
+        }
+
+    def _render(self, prefix: str, remaining: float) -> str:
+        if remaining <= 0:
+            return f"{prefix} почти готово..."
+        rounded = int(-(-remaining // self._step) * self._step)
+        return f"{prefix}... ~{rounded} сек осталось"
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._tick)
+            if not self._handles:
+                continue
+            try:
+                await self._tick_once()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Progress tick failed: %s", exc)
+
+    async def _tick_once(self) -> None:
+        now = time.monotonic()
+        changed: List[ProgressHandle] = []
+        for handle in self._handles.values():
+            text = self._render(handle.prefix, handle.total_seconds - (now - handle.started_at))
+            if text == handle.last_text:
+                self.skipped += 1
+                continue
+            changed.append(handle)
+        changed.sort(key=lambda item: item.last_edit_at)
+        to_edit = changed[: self._edits_per_tick]
+        to_signal = [
+            handle
+            for handle in changed[self._edits_per_tick:]
+            if now - handle.last_action_at >= self._chat_action_ttl
+        ]
+        await asyncio.gather(
+            *(self._edit(handle, now) for handle in to_edit),
+            *(self._signal(handle, now) for handle in to_signal),
+        )
+
+    async def _edit(self, handle: ProgressHandle, now: float) -> None:
+        text = self._render(handle.prefix, handle.total_seconds - (now - handle.started_at))
+        handle.last_text = text
+        handle.last_edit_at = now
+        async with handle.lock:
+            # finish() may have replaced the message with its final text meanwhile.
+            if handle.id not in self._handles:
+                return
+            self.edits += 1
+            try:
+                await outbound.send(handle.message.chat.id, partial(handle.message.edit_text, text), PRIORITY_PROGRESS)
+            except Exception:  # noqa: BLE001
+                pass
+
+    async def _signal(self, handle: ProgressHandle, now: float) -> None:
+        handle.last_action_at = now
+        self.chat_actions += 1
+        try:
+            await outbound.send(
+                handle.message.chat.id,
+                partial(handle.message.bot.send_chat_action, handle.message.chat.id, handle.chat_action),
+                PRIORITY_PROGRESS,
+            )
+        except Exception:  # noqa: BLE001
+            pass
+
+
+progress_ticker = ProgressTicker(
+    tick_seconds=settings.progress_tick_seconds,
+    step_seconds=settings.progress_step_seconds,
+    edits_per_second=settings.progress_edits_per_second,
+)
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import tempfile
+from io import BytesIO
+from typing import AsyncIterator, List, Optional
+
+from aiogram import types
+
+from config import settings
+
+
+class ResultBuffer:
+    """Generated payload that lives in memory or, when large, in a temp file.
+
+    Small results are handed to Telegram through a ``BytesIO`` that shares the
+    original ``bytes`` object. Large ones are written to disk and the upload
+    streams from the file, so the process does not keep them resident.
+    """
+
+    def __init__(self, data: Optional[bytes] = None, path: Optional[str] = None, size: int = 0) -> None:
+        self._data = data
+        self._path = path
+        self.size = size
+        self._handles: List = []
+
+    @property
+    def spilled(self) -> bool:
+        return self._path is not None
+
+    @classmethod
+    async def from_bytes(cls, data: bytes, threshold: Optional[int] = None) -> "ResultBuffer":
+        threshold = settings.result_spill_threshold if threshold is None else threshold
+        if len(data) <= threshold:
+            return cls(data=data, size=len(data))
+        path = await asyncio.to_thread(_write_temp_file, [data])
+        return cls(path=path, size=len(data))
+
+    @classmethod
+    async def from_stream(cls, chunks: AsyncIterator[bytes], threshold: Optional[int] = None) -> "ResultBuffer":
+        threshold = settings.result_spill_threshold if threshold is None else threshold
+        head: List[bytes] = []
+        size = 0
+        async for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > threshold:
+                break
+        else:
+            return cls(data=b"".join(head), size=size)
+
+        handle = await asyncio.to_thread(_open_temp_file)
+        try:
+            await asyncio.to_thread(handle.writelines, head)
+            head.clear()
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write, chunk)
+                size += len(chunk)
+        except BaseException:
+            handle.close()
+            os.unlink(handle.name)
+            raise
+        handle.close()
+        return cls(path=handle.name, size=size)
+
+    def as_input_file(self, filename: str) -> types.InputFile:
+        if self._path is not None:
+            handle = open(self._path, "rb")
+            self._handles.append(handle)
+            return types.InputFile(handle, filename=filename)
+        return types.InputFile(BytesIO(self._data), filename=filename)
+
+    def close(self) -> None:
+        for handle in self._handles:
+            handle.close()
+        self._handles.clear()
+        if self._path is not None:
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+            self._path = None
+        self._data = None
+
+    def __enter__(self) -> "ResultBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def _open_temp_file():
+    return tempfile.NamedTemporaryFile(prefix="nanobanana-", dir=settings.result_spill_dir, delete=False)
+
+
+def _write_temp_file(chunks: List[bytes]) -> str:
+    handle = _open_temp_file()
+    with handle:
+        handle.writelines(chunks)
+    return handle.name
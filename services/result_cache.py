@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import settings
+from utils.redis_client import get_redis
+
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split()).casefold()
+
+
+def text2img_cache_key(prompt: str, resolved_model: str, config: dict) -> str:
+    raw = json.dumps(
+        {"prompt": normalize_prompt(prompt), "model": resolved_model, "config": config},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def preset_cache_key(file_unique_id: str, preset_key: str, preset_prompt: str, resolved_model: str) -> str:
+    # The prompt digest is part of the key, so editing a preset's text in
+    # utils/presets.py makes its old entries unreachable; they age out via LRU/TTL.
+    prompt_version = hashlib.sha256(preset_prompt.encode("utf-8")).hexdigest()[:16]
+    return f"{file_unique_id}:{preset_key}:{prompt_version}:{resolved_model}"
+
+
+class MemoryResultCache:
+    """Process-local LRU of result file_ids with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, file_id: str) -> None:
+        self._entries[key] = (time.monotonic() + self._ttl, file_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class RedisResultCache:
+    def __init__(self, redis, namespace: str, ttl_seconds: int) -> None:
+        self._redis = redis
+        self._prefix = f"nanobanana:{namespace}:"
+        self._ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            value = await self._redis.get(self._prefix + key)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Result cache lookup failed: %s", exc)
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, file_id: str) -> None:
+        try:
+            await self._redis.set(self._prefix + key, file_id, ex=self._ttl)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Result cache store failed: %s", exc)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self._redis.delete(self._prefix + key)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Result cache delete failed: %s", exc)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+def build_result_cache(namespace: str):
+    if settings.result_cache_backend == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisResultCache(redis, namespace, settings.result_cache_ttl)
+        logger.warning("Redis result cache requested but Redis is unavailable. Using memory cache.")
+    return MemoryResultCache(settings.result_cache_max_entries, settings.result_cache_ttl)
+
+
+text2img_cache = build_result_cache("text2img")
+preset_cache = build_result_cache("preset")
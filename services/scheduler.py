@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from config import settings
+from db.repositories import fail_and_refund_generations, fail_stale_generations
+
+
+logger = logging.getLogger(__name__)
+
+
+JobRunner = Callable[..., Awaitable[None]]
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+@dataclass
+class GenerationJob:
+    lane: str
+    tg_id: int
+    run: JobRunner
+    generation_id: Optional[int] = None
+    user_id: Optional[int] = None
+    refund_diamonds: int = 0
+    refund_bananas: int = 0
+
+
+class _Lane:
+    def __init__(self, name: str, concurrency: int) -> None:
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.pending: Deque[GenerationJob] = deque()
+        self.items = asyncio.Semaphore(0)
+        self.active = 0
+
+
+class GenerationScheduler:
+    """Bounded FIFO of generation jobs drained by a fixed worker pool.
+
+    Every lane (``nano``, ``pro``, ``animate``) has its own concurrency cap;
+    the total number of running jobs is additionally capped by ``workers``.
+    Jobs receive a fresh DB session because the update's session is closed
+    as soon as the handler returns.
+    """
+
+    def __init__(self, workers: int, queue_size: int, lane_limits: Dict[str, int]) -> None:
+        self._queue_size = queue_size
+        self._lanes = {name: _Lane(name, limit) for name, limit in lane_limits.items()}
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self._workers = max(1, workers)
+        self._session_factory = None
+        self._tasks: List[asyncio.Task] = []
+        self._running: List[GenerationJob] = []
+
+    def lane_for(self, model: Optional[str]) -> str:
+        if model in self._lanes:
+            return model
+        return "nano"
+
+    def start(self, session_factory) -> None:
+        if self._tasks:
+            return
+        self._session_factory = session_factory
+        for lane in self._lanes.values():
+            for _ in range(min(lane.concurrency, self._workers)):
+                self._tasks.append(asyncio.create_task(self._worker(lane)))
+
+    async def fail_stale(self, session_factory, max_age: float) -> None:
+        """Refund generations that a crashed process left ``processing``; run before ``start``."""
+        created_before = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+        session = session_factory()
+        try:
+            refunded = await fail_stale_generations(
+                session, created_before, error="bot restarted before the job finished"
+            )
+            if refunded:
+                logger.info("Refunded stale generations of %s users", refunded)
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to refund stale generations")
+        finally:
+            await session.close()
+
+    async def stop(self) -> None:
+        # Taken before cancelling: the workers drop their jobs from ``_running`` as they unwind.
+        interrupted = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        abandoned = interrupted + [job for lane in self._lanes.values() for job in lane.pending]
+        for lane in self._lanes.values():
+            lane.pending.clear()
+        if abandoned and self._session_factory is not None:
+            await self._refund(abandoned)
+
+    async def _refund(self, jobs: List[GenerationJob]) -> None:
+        session = self._session_factory()
+        try:
+            refunded = await fail_and_refund_generations(
+                session,
+                [
+                    (job.generation_id, job.user_id, job.refund_diamonds, job.refund_bananas)
+                    for job in jobs
+                    if job.generation_id is not None and job.user_id is not None
+                ],
+                error="bot stopped before the job finished",
+            )
+            logger.info("Refunded %s of %s abandoned generation jobs", refunded, len(jobs))
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to refund %s abandoned generation jobs", len(jobs))
+        finally:
+            await session.close()
+
+    def submit(self, job: GenerationJob) -> int:
+        lane = self._lanes[job.lane]
+        if self.queue_depth() >= self._queue_size:
+            raise QueueFullError("Generation queue is full")
+        lane.pending.append(job)
+        lane.items.release()
+        return len(lane.pending)
+
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        if lane is not None:
+            return len(self._lanes[lane].pending)
+        return sum(len(item.pending) for item in self._lanes.values())
+
+    def active_count(self, lane: Optional[str] = None) -> int:
+        if lane is not None:
+            return self._lanes[lane].active
+        return sum(item.active for item in self._lanes.values())
+
+    def free_slots(self, lane: str) -> int:
+        item = self._lanes[lane]
+        return max(0, item.concurrency - item.active)
+
+    def position(self, tg_id: int) -> Optional[int]:
+        for lane in self._lanes.values():
+            for index, job in enumerate(lane.pending, start=1):
+                if job.tg_id == tg_id:
+                    return index
+        return None
+
+    async def _worker(self, lane: _Lane) -> None:
+        while True:
+            await lane.items.acquire()
+            async with self._slots:
+                job = lane.pending.popleft()
+                lane.active += 1
+                self._running.append(job)
+                try:
+                    await self._run(job)
+                finally:
+                    self._running.remove(job)
+                    lane.active -= 1
+
+    async def _run(self, job: GenerationJob) -> None:
+        session = self._session_factory()
+        try:
+            await job.run(session)
+        except Exception:  # noqa: BLE001
+            logger.exception("Generation job failed in lane %s", job.lane)
+        finally:
+            await session.close()
+
+
+generation_scheduler = GenerationScheduler(
+    workers=settings.per_process(settings.generation_workers),
+    queue_size=settings.per_process(settings.generation_queue_size),
+    lane_limits={
+        "nano": settings.per_process(settings.generation_nano_concurrency),
+        "pro": settings.per_process(settings.generation_pro_concurrency),
+        "animate": settings.per_process(settings.generation_animate_concurrency),
+    },
+)
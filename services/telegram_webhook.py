@@ -0,0 +1,75 @@
+import asyncio
+import hmac
+import logging
+from typing import Awaitable, Callable, Set
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+Hook = Callable[[Dispatcher], Awaitable[None]]
+
+
+async def set_webhook(bot: Bot) -> None:
+    # aiogram 2.7 predates the ``secret_token`` argument, so call the Bot API method directly.
+    await bot.request(
+        "setWebhook",
+        {
+            "url": settings.webhook_url.rstrip("/") + settings.webhook_path,
+            "secret_token": settings.webhook_secret,
+            "max_connections": settings.webhook_max_connections,
+        },
+    )
+
+
+def build_webhook_app(dp: Dispatcher, on_startup: Hook, on_shutdown: Hook) -> web.Application:
+    """aiohttp app that accepts Telegram updates on ``WEBHOOK_PATH``.
+
+    Requests without the right secret token header get 401. Each update is
+    acknowledged at once and processed in its own task through the regular
+    dispatcher, so the middleware stack is the same as in polling mode.
+    """
+    pending: Set[asyncio.Task] = set()
+
+    async def process(update: types.Update) -> None:
+        try:
+            await dp.process_update(update)
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to process update %s", update.update_id)
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, settings.webhook_secret):
+            return web.Response(status=401)
+        update = types.Update(**(await request.json()))
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        task = asyncio.create_task(process(update))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        return web.Response()
+
+    async def startup(_app: web.Application) -> None:
+        Bot.set_current(dp.bot)
+        Dispatcher.set_current(dp)
+        await on_startup(dp)
+
+    async def cleanup(_app: web.Application) -> None:
+        if pending:
+            await asyncio.wait(set(pending), timeout=settings.webhook_shutdown_timeout)
+        await on_shutdown(dp)
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        await dp.bot.close()
+
+    app = web.Application()
+    app.router.add_post(settings.webhook_path, handle)
+    app.on_startup.append(startup)
+    app.on_cleanup.append(cleanup)
+    return app
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _TrackedOperation:
+    operation: object
+    future: asyncio.Future
+    delay: float
+    next_poll: float
+    errors: int = 0
+
+
+class VeoOperationPoller:
+    """Single task that polls every outstanding VEO operation.
+
+    Callers ``await wait(operation)`` and get the finished operation back;
+    while waiting they hold no thread and no connection. Each operation is
+    re-polled with exponential backoff, and due operations are fetched
+    concurrently in batches of at most ``batch_size``.
+    """
+
+    def __init__(
+        self,
+        client,
+        initial_delay: float,
+        max_delay: float,
+        backoff: float,
+        batch_size: int,
+        max_errors: int = 5,
+    ) -> None:
+        self._client = client
+        self._initial_delay = initial_delay
+        self._max_delay = max_delay
+        self._backoff = backoff
+        self._batch_size = max(1, batch_size)
+        self._max_errors = max_errors
+        self._pending: Dict[str, _TrackedOperation] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def wait(self, operation):
+        if operation.done:
+            return operation
+        loop = asyncio.get_running_loop()
+        tracked = _TrackedOperation(
+            operation=operation,
+            future=loop.create_future(),
+            delay=self._initial_delay,
+            next_poll=loop.time() + self._initial_delay,
+        )
+        self._pending[operation.name] = tracked
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+        try:
+            return await tracked.future
+        finally:
+            self._pending.pop(operation.name, None)
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for tracked in self._pending.values():
+            if not tracked.future.done():
+                tracked.future.set_exception(RuntimeError("VEO poller stopped"))
+        self._pending.clear()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._pending:
+                await self._wakeup.wait()
+                continue
+            now = loop.time()
+            due = [item for item in self._pending.values() if item.next_poll <= now]
+            if not due:
+                timeout = min(item.next_poll for item in self._pending.values()) - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due.sort(key=lambda item: item.next_poll)
+            await self._poll_batch(due[: self._batch_size])
+
+    async def _poll_batch(self, batch: List[_TrackedOperation]) -> None:
+        results = await asyncio.gather(
+            *(self._client.aio.operations.get(item.operation) for item in batch),
+            return_exceptions=True,
+        )
+        now = asyncio.get_running_loop().time()
+        for item, result in zip(batch, results):
+            if item.future.done():
+                continue
+            if isinstance(result, BaseException):
+                item.errors += 1
+                logger.warning("Failed to poll VEO operation %s: %s", item.operation.name, result)
+                if item.errors >= self._max_errors:
+                    item.future.set_exception(RuntimeError(f"Video generation polling failed: {result}"))
+                    continue
+            else:
+                item.errors = 0
+                item.operation = result
+                if result.done:
+                    item.future.set_result(result)
+                    continue
+            item.delay = min(item.delay * self._backoff, self._max_delay)
+            item.next_poll = now + item.delay
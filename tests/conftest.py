@@ -0,0 +1,77 @@
+"""Database tests run against a real Postgres given by ``TEST_DATABASE_URL``.
+
+The database is migrated with ``db/migrate.py`` and truncated before each
+test; without the variable the tests are skipped.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# config.Settings is loaded at import time and requires these.
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or "postgresql+asyncpg://localhost/nanobanana_test"
+os.environ["USER_CACHE_BACKEND"] = "none"
+
+_TABLES = "users, transactions, generations, referrals, action_logs"
+
+
+async def _with_sessions(database_url: str, scenario):
+    from db.session import create_engine, create_session_factory
+
+    engine = create_engine(database_url)
+    try:
+        return await scenario(create_session_factory(engine))
+    finally:
+        await engine.dispose()
+
+
+async def _funded_user(session_factory, tg_id: int, diamonds: int) -> int:
+    from db.repositories import adjust_balances, get_or_create_user
+
+    async with session_factory() as session:
+        user = await get_or_create_user(session, tg_id, f"user{tg_id}")
+        await adjust_balances(session, user.id, diamonds_delta=diamonds)
+        return user.id
+
+
+async def _reset(database_url: str) -> None:
+    import asyncpg
+
+    from db.migrate import _dsn, migrate
+
+    await migrate(database_url)
+    conn = await asyncpg.connect(_dsn(database_url))
+    try:
+        await conn.execute(f"TRUNCATE {_TABLES} RESTART IDENTITY CASCADE")
+    finally:
+        await conn.close()
+
+
+@pytest.fixture
+def database_url() -> str:
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    asyncio.run(_reset(TEST_DATABASE_URL))
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def run_with_sessions(database_url):
+    """Run ``scenario(session_factory)`` against the test database and return its result."""
+
+    def run(scenario):
+        return asyncio.run(_with_sessions(database_url, scenario))
+
+    return run
+
+
+@pytest.fixture
+def funded_user():
+    """``await funded_user(session_factory, tg_id, diamonds)`` creates a user with that balance, returns its id."""
+    return _funded_user
@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from aiogram.utils.exceptions import RetryAfter
+
+import handlers.admin
+from services.log_export import LogExport, LogExportFilters, LogExportPart
+from services.outbound import OutboundSender
+from services.result_buffer import ResultBuffer
+
+
+def test_export_retry_uploads_a_fresh_full_file(tmp_path, monkeypatch):
+    payload = b"x" * 100_000
+    path = tmp_path / "part.gz"
+    path.write_bytes(payload)
+    export = LogExport(
+        parts=[LogExportPart(buffer=ResultBuffer(path=str(path), size=len(payload)), rows=3, filename="a.csv.gz")],
+        rows=3,
+    )
+    uploads = []
+
+    async def answer_document(document, caption=None):
+        uploads.append(document.file.read())
+        if len(uploads) == 1:
+            raise RetryAfter(0)
+        return SimpleNamespace(caption=caption)
+
+    async def fake_export(session_factory, filters, fmt):
+        return export
+
+    async def scenario():
+        sender = OutboundSender(global_rate=100, chat_rate=100, chat_burst=10, max_retries=3, concurrency=2)
+        monkeypatch.setattr(handlers.admin, "outbound", sender)
+        monkeypatch.setattr(handlers.admin, "export_action_logs", fake_export)
+        message = SimpleNamespace(chat=SimpleNamespace(id=1), answer_document=answer_document)
+        try:
+            await handlers.admin._run_export(message, None, LogExportFilters(), "csv")
+        finally:
+            await sender.stop()
+
+    asyncio.run(scenario())
+    assert uploads == [payload, payload]
+    assert not path.exists()
+
+
+def test_export_args_parse_into_filters():
+    filters, fmt = handlers.admin._parse_export_args("from=2024-01-01 to=2024-01-31 action=start tg_id=42 format=jsonl")
+
+    assert filters.date_from == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # "to" is inclusive: the filter stops at the start of the next day.
+    assert filters.date_to == datetime(2024, 2, 1, tzinfo=timezone.utc)
+    assert (filters.action, filters.tg_id, fmt) == ("start", 42, "jsonl")
+    assert handlers.admin._parse_export_args("") == (LogExportFilters(), "csv")
+
+
+@pytest.mark.parametrize("args", ["from=2024-13-01", "tg_id=abc", "format=xlsx", "level=debug", "action", "action="])
+def test_export_args_reject_bad_values(args):
+    with pytest.raises(ValueError):
+        handlers.admin._parse_export_args(args)
@@ -0,0 +1,125 @@
+import asyncio
+import warnings
+from decimal import Decimal
+
+from sqlalchemy import exc, select
+
+from config import settings
+from db.models import Generation, Transaction, User
+from db.repositories import (
+    confirm_topup,
+    create_transaction,
+    debit_and_create_generation,
+    get_or_create_user,
+)
+
+
+def test_debit_charges_funded_user(run_with_sessions, funded_user):
+    async def scenario(session_factory):
+        user_id = await funded_user(session_factory, 1001, diamonds=10)
+        async with session_factory() as session:
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", exc.SAWarning)
+                generation_id = await debit_and_create_generation(
+                    session,
+                    user_id,
+                    cost_diamonds=3,
+                    cost_bananas=0,
+                    method="nano",
+                    payload={"prompt": "cat"},
+                    kind="text2img",
+                    model="nano",
+                    prompt="cat",
+                    preset=None,
+                )
+            assert generation_id is not None
+
+        async with session_factory() as session:
+            user = (await session.execute(select(User).where(User.id == user_id))).scalar_one()
+            assert user.diamonds == 7
+            generation = await session.get(Generation, generation_id)
+            assert generation.user_id == user_id
+            assert generation.status == "processing"
+            spend = (
+                await session.execute(select(Transaction).where(Transaction.type == "spend"))
+            ).scalar_one()
+            assert spend.user_id == user_id
+            assert spend.amount_diamonds == 3
+            assert spend.amount_usdt == Decimal("0")
+
+    run_with_sessions(scenario)
+
+
+def test_debit_without_balance_writes_nothing(run_with_sessions, funded_user):
+    async def scenario(session_factory):
+        user_id = await funded_user(session_factory, 1002, diamonds=2)
+        async with session_factory() as session:
+            generation_id = await debit_and_create_generation(
+                session,
+                user_id,
+                cost_diamonds=3,
+                cost_bananas=0,
+                method="nano",
+                payload=None,
+                kind="text2img",
+                model="nano",
+                prompt="cat",
+                preset=None,
+            )
+            assert generation_id is None
+        async with session_factory() as session:
+            user = (await session.execute(select(User).where(User.id == user_id))).scalar_one()
+            assert user.diamonds == 2
+            assert (await session.execute(select(Generation))).first() is None
+            assert (await session.execute(select(Transaction).where(Transaction.type == "spend"))).first() is None
+
+    run_with_sessions(scenario)
+
+
+def test_parallel_confirmations_credit_once(run_with_sessions):
+    confirmations = 8
+
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            referrer = await get_or_create_user(session, 2001, "referrer")
+            buyer = await get_or_create_user(session, 2002, "buyer", ref_code=referrer.referral_code)
+            referrer_id, buyer_id = referrer.id, buyer.id
+            assert buyer.referrer_id == referrer_id
+            await create_transaction(
+                session,
+                buyer_id,
+                "topup",
+                method="crypto",
+                amount_diamonds=100,
+                amount_usdt=Decimal("5"),
+                external_id="order-1",
+            )
+
+        async def confirm():
+            async with session_factory() as session:
+                return await confirm_topup(session, "order-1")
+
+        results = await asyncio.gather(*(confirm() for _ in range(confirmations)))
+        confirmed = [tx for tx in results if tx is not None]
+        assert len(confirmed) == 1
+        assert confirmed[0].status == "paid"
+        assert confirmed[0].amount_diamonds == 100
+
+        bonus = (Decimal("100") * Decimal(str(settings.referral_percent)) / 100).quantize(Decimal("0.01"))
+        async with session_factory() as session:
+            buyer = (await session.execute(select(User).where(User.id == buyer_id))).scalar_one()
+            referrer = (await session.execute(select(User).where(User.id == referrer_id))).scalar_one()
+            assert buyer.diamonds == 100
+            assert referrer.usdt_balance == bonus
+            assert referrer.earned_usdt == bonus
+            bonus_txs = (
+                await session.execute(select(Transaction).where(Transaction.type == "referral_bonus"))
+            ).scalars().all()
+            assert len(bonus_txs) == 1
+            assert bonus_txs[0].user_id == referrer_id
+            assert bonus_txs[0].amount_usdt == bonus
+            assert bonus_txs[0].amount_diamonds == 0
+            assert bonus_txs[0].amount_bananas == 0
+            assert bonus_txs[0].payload == {"source_tx": "order-1"}
+
+    run_with_sessions(scenario)
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from services.file_cache import FileDownloadCache
+
+
+def test_concurrent_fetches_share_one_download():
+    cache = FileDownloadCache(max_bytes=1000, path_ttl_seconds=60)
+    downloads = 0
+
+    async def fetch():
+        nonlocal downloads
+        downloads += 1
+        await asyncio.sleep(0.01)
+        return b"photo", "image/jpeg"
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_fetch("unique", fetch) for _ in range(5)))
+        assert results == [(b"photo", "image/jpeg")] * 5
+        assert await cache.get_or_fetch("unique", fetch) == (b"photo", "image/jpeg")
+
+    asyncio.run(scenario())
+    assert downloads == 1
+    stats = cache.stats()
+    assert (stats["misses"], stats["shared"], stats["hits"]) == (1, 4, 1)
+
+
+def test_failed_download_reaches_every_waiter_and_is_not_cached():
+    cache = FileDownloadCache(max_bytes=1000, path_ttl_seconds=60)
+    downloads = 0
+
+    async def fetch():
+        nonlocal downloads
+        downloads += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("telegram is down")
+
+    async def scenario():
+        results = await asyncio.gather(
+            *(cache.get_or_fetch("unique", fetch) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_fetch("unique", fetch)
+
+    asyncio.run(scenario())
+    assert downloads == 2
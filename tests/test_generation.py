@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+import handlers.generation
+from db.models import Generation, Transaction, User
+from handlers.generation import handle_text_prompt, nanobanana_client
+from services.outbound import OutboundSender
+from services.result_cache import MemoryResultCache, text2img_cache_key
+
+
+def test_cache_hit_is_sent_without_charging(run_with_sessions, funded_user, monkeypatch):
+    cache = MemoryResultCache(max_entries=10, ttl_seconds=60)
+    sender = OutboundSender(global_rate=100, chat_rate=100, chat_burst=10, max_retries=1, concurrency=2)
+    monkeypatch.setattr(handlers.generation, "text2img_cache", cache)
+    monkeypatch.setattr(handlers.generation, "outbound", sender)
+    sent = []
+
+    async def answer_photo(photo, caption=None):
+        sent.append(photo)
+
+    async def scenario(session_factory):
+        user_id = await funded_user(session_factory, 4001, diamonds=10)
+        async with session_factory() as session:
+            user = await session.get(User, user_id)
+            await cache.set(
+                text2img_cache_key(
+                    "cat", nanobanana_client.resolve_model(user.selected_model), nanobanana_client.image_config
+                ),
+                "cached-file-id",
+            )
+            message = SimpleNamespace(
+                text="cat",
+                chat=SimpleNamespace(id=4001),
+                from_user=SimpleNamespace(id=4001),
+                answer_photo=answer_photo,
+            )
+            await handle_text_prompt(message, session, user)
+        await sender.stop()
+
+        async with session_factory() as session:
+            user = await session.get(User, user_id)
+            assert user.diamonds == 10
+            generation = (await session.execute(select(Generation))).scalar_one()
+            assert (generation.status, generation.result_url) == ("completed", "cached-file-id")
+            assert (generation.cost_diamonds, generation.cost_bananas) == (0, 0)
+            assert (await session.execute(select(Transaction))).first() is None
+
+    run_with_sessions(scenario)
+    assert sent == ["cached-file-id"]
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from handlers.history import _decode_cursor, _encode_cursor
+
+
+def test_cursor_round_trips_exact_microseconds():
+    created_at = datetime(2024, 3, 5, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    row = SimpleNamespace(created_at=created_at, id=42)
+
+    assert _decode_cursor(_encode_cursor(row)) == (created_at, 42)
+
+
+def test_cursor_keeps_instant_across_time_zones_and_fits_callback_data():
+    created_at = datetime(2262, 4, 11, 23, 47, 16, 854775, tzinfo=timezone(timedelta(hours=3)))
+    row = SimpleNamespace(created_at=created_at, id=2**63 - 1)
+    cursor = _encode_cursor(row)
+
+    decoded_at, decoded_id = _decode_cursor(cursor)
+    assert decoded_at == created_at
+    assert decoded_at.tzinfo == timezone.utc
+    assert decoded_id == row.id
+    # Telegram limits callback_data to 64 bytes.
+    assert len(f"hist:older:{cursor}".encode()) <= 64
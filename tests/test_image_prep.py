@@ -0,0 +1,30 @@
+from io import BytesIO
+from types import SimpleNamespace
+
+from PIL import Image
+
+from services.image_prep import _downscale, pick_photo_size
+
+
+def _png(width: int, height: int) -> bytes:
+    output = BytesIO()
+    Image.new("RGBA", (width, height), (255, 0, 0, 128)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_pick_photo_size_takes_smallest_covering_size():
+    sizes = [SimpleNamespace(width=side, height=side * 3 // 4) for side in (1280, 90, 320, 800)]
+
+    assert pick_photo_size(sizes, 700).width == 800
+    assert pick_photo_size(sizes, 320).width == 320
+    # Nothing covers the target: fall back to the largest size.
+    assert pick_photo_size(sizes, 2048).width == 1280
+
+
+def test_downscale_shrinks_large_images_only():
+    assert _downscale(_png(400, 300), max_side=512, quality=85) is None
+
+    resized = _downscale(_png(2000, 1000), max_side=512, quality=85)
+    with Image.open(BytesIO(resized)) as image:
+        assert image.format == "JPEG"
+        assert image.size == (512, 256)
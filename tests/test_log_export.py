@@ -0,0 +1,49 @@
+import csv
+import dataclasses
+import gzip
+import io
+import os
+import random
+import string
+
+from sqlalchemy import text
+
+import services.log_export
+from config import settings
+from services.log_export import LogExportFilters, export_action_logs
+
+
+def test_export_splits_into_standalone_parts(run_with_sessions, monkeypatch):
+    monkeypatch.setattr(
+        services.log_export,
+        "settings",
+        dataclasses.replace(settings, log_export_chunk_size=100, log_export_part_bytes=20_000),
+    )
+    # Random usernames keep the archive from compressing to almost nothing.
+    noise = random.Random(1)
+    usernames = ["".join(noise.choices(string.ascii_letters, k=40)) for _ in range(2000)]
+
+    async def scenario(session_factory):
+        async with session_factory() as session:
+            await session.execute(
+                text("INSERT INTO action_logs (tg_id, username, action) VALUES (:tg_id, :username, 'test')"),
+                [{"tg_id": index, "username": username} for index, username in enumerate(usernames)],
+            )
+            await session.commit()
+        return await export_action_logs(session_factory, LogExportFilters(), "csv")
+
+    export = run_with_sessions(scenario)
+    with export:
+        assert export.rows == len(usernames)
+        assert len(export.parts) > 1
+        assert export.parts[1].filename == "action_logs.part02.csv.gz"
+        exported = []
+        for part in export.parts:
+            with open(part.buffer._path, "rb") as handle:
+                rows = list(csv.reader(io.StringIO(gzip.decompress(handle.read()).decode("utf-8"))))
+            assert rows[0][0] == "id"
+            assert len(rows) - 1 == part.rows
+            exported.extend(row[2] for row in rows[1:])
+        assert sorted(exported) == sorted(usernames)
+        paths = [part.buffer._path for part in export.parts]
+    assert not any(os.path.exists(path) for path in paths)
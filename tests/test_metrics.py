@@ -0,0 +1,13 @@
+from services.metrics import MetricsRegistry
+
+
+def test_snapshot_reports_failing_source_without_hiding_others():
+    registry = MetricsRegistry(interval=0)
+    registry.register("pool", lambda: {"in_use": 2, "wait_avg": 0.25})
+    registry.register("broken", lambda: 1 / 0)
+
+    snapshot = registry.snapshot()
+
+    assert snapshot["pool"] == {"in_use": 2, "wait_avg": 0.25}
+    assert "error" in snapshot["broken"]
+    assert registry.render().splitlines()[0] == "pool: in_use=2, wait_avg=0.250"
@@ -0,0 +1,29 @@
+import asyncio
+
+import asyncpg
+
+import db.migrate
+from db.migrate import _LOCK_ID, _dsn, migrate
+
+
+def test_migrate_polls_for_the_lock_without_a_running_statement(database_url, monkeypatch):
+    monkeypatch.setattr(db.migrate, "_LOCK_RETRY_SECONDS", 0.05)
+
+    async def scenario():
+        holder = await asyncpg.connect(_dsn(database_url))
+        try:
+            await holder.execute("SELECT pg_advisory_lock($1)", _LOCK_ID)
+            waiter = asyncio.create_task(migrate(database_url))
+            await asyncio.sleep(0.3)
+            assert not waiter.done()
+            # A waiter blocked in pg_advisory_lock would show up here and stall CREATE INDEX CONCURRENTLY.
+            blocked = await holder.fetchval(
+                "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND NOT granted"
+            )
+            assert blocked == 0
+            await holder.execute("SELECT pg_advisory_unlock($1)", _LOCK_ID)
+            assert await asyncio.wait_for(waiter, 5) == []
+        finally:
+            await holder.close()
+
+    asyncio.run(scenario())
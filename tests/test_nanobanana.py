@@ -0,0 +1,35 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.nanobanana import NanoBananaClient
+
+
+def test_aio_backend_awaits_the_sdk_within_the_inflight_limit():
+    active = 0
+    peak = 0
+
+    async def generate_content(**request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        part = SimpleNamespace(inline_data=SimpleNamespace(data=request["model"].encode()))
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+    client = NanoBananaClient(api_key="test", nano_model="nano-model", backend="aio")
+    # No sync ``models`` attribute: any to_thread fallback would fail.
+    client._client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+
+    async def scenario():
+        client._inflight = asyncio.Semaphore(2)
+        results = await asyncio.gather(*(client.generate_text2img("cat", "nano") for _ in range(5)))
+        payloads = []
+        for result in results:
+            with result:
+                upload = result.as_input_file("a.png")
+                payloads.append(upload.file.read())
+        return payloads
+
+    assert asyncio.run(scenario()) == [b"nano-model"] * 5
+    assert peak == 2
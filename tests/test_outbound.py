@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from aiogram.bot.base import BaseBot
+from aiogram.utils.exceptions import RetryAfter
+
+import services.outbound
+from services.outbound import (
+    PRIORITY_NOTICE,
+    PRIORITY_PROGRESS,
+    PRIORITY_RESULT,
+    OutboundBot,
+    OutboundSender,
+)
+
+
+def test_bot_routes_chat_calls_through_outbound_once(monkeypatch):
+    sender = OutboundSender(global_rate=100, chat_rate=100, chat_burst=10, max_retries=1, concurrency=2)
+    monkeypatch.setattr(services.outbound, "outbound", sender)
+    calls = []
+
+    async def fake_request(self, method, data=None, files=None, **kwargs):
+        calls.append(method)
+        return {"ok": True}
+
+    monkeypatch.setattr(BaseBot, "request", fake_request)
+
+    async def scenario():
+        bot = OutboundBot(token="123:abc")
+        try:
+            await bot.request("sendMessage", {"chat_id": 1, "text": "hi"})
+            await sender.send(1, lambda: bot.request("editMessageText", {"chat_id": 1, "text": "hi"}))
+            await bot.request("answerCallbackQuery", {"callback_query_id": "1"})
+        finally:
+            await sender.stop()
+            await bot.close()
+
+    asyncio.run(scenario())
+    assert calls == ["sendMessage", "editMessageText", "answerCallbackQuery"]
+    assert sender.stats()["sent"] == 2
+
+
+def test_chat_bucket_paces_sends_and_results_go_first():
+    sender = OutboundSender(global_rate=100, chat_rate=20, chat_burst=1, max_retries=1, concurrency=1)
+    sent = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+
+        def call(name):
+            async def run():
+                sent.append((name, loop.time()))
+
+            return run
+
+        try:
+            await asyncio.gather(
+                sender.send(1, call("progress"), PRIORITY_PROGRESS),
+                sender.send(1, call("notice"), PRIORITY_NOTICE),
+                sender.send(1, call("result"), PRIORITY_RESULT),
+            )
+        finally:
+            await sender.stop()
+
+    asyncio.run(scenario())
+    # All three are queued before the sender runs, so the chat's single token goes by priority.
+    assert [name for name, _ in sent] == ["result", "notice", "progress"]
+    gaps = [later - earlier for (_, earlier), (_, later) in zip(sent, sent[1:])]
+    assert all(gap >= 0.04 for gap in gaps)
+
+
+def test_retry_after_requeues_until_max_retries():
+    sender = OutboundSender(global_rate=100, chat_rate=100, chat_burst=10, max_retries=2, concurrency=2)
+    attempts = {"flaky": 0, "flooded": 0}
+
+    def failing(name, failures):
+        async def run():
+            attempts[name] += 1
+            if attempts[name] <= failures:
+                raise RetryAfter(0)
+            return name
+
+        return run
+
+    async def scenario():
+        try:
+            assert await sender.send(1, failing("flaky", 2)) == "flaky"
+            with pytest.raises(RetryAfter):
+                await sender.send(2, failing("flooded", 10))
+        finally:
+            await sender.stop()
+
+    asyncio.run(scenario())
+    assert attempts == {"flaky": 3, "flooded": 3}
+    assert sender.stats()["retried"] == 4
+    assert sender.stats()["failed"] == 1
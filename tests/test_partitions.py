@@ -0,0 +1,65 @@
+from datetime import datetime, time, timedelta, timezone
+
+from sqlalchemy import text
+
+from db.partitions import _LOCK_ID, ActionLogPartitionManager, _add_months
+
+
+async def _insert_log(session, created_at: datetime) -> None:
+    await session.execute(
+        text("INSERT INTO action_logs (tg_id, action, created_at) VALUES (1, 'test', :created_at)"),
+        {"created_at": created_at},
+    )
+
+
+def test_maintenance_moves_default_rows_and_prunes_them(run_with_sessions):
+    async def scenario(session_factory):
+        today = datetime.now(timezone.utc).date()
+        month = _add_months(today.replace(day=1), 5)
+        partition = f"action_logs_{month:%Y%m}"
+        async with session_factory() as session:
+            await session.execute(text(f'DROP TABLE IF EXISTS "{partition}"'))
+            await _insert_log(session, datetime.combine(month + timedelta(days=9), time(12), timezone.utc))
+            await _insert_log(session, datetime(2001, 1, 1, tzinfo=timezone.utc))
+            await session.commit()
+
+        manager = ActionLogPartitionManager(months_ahead=5, retention_months=6, interval=3600)
+        manager._session_factory = session_factory
+        await manager.run_once(today)
+
+        async with session_factory() as session:
+            assert (await session.execute(text(f'SELECT count(*) FROM "{partition}"'))).scalar_one() == 1
+            assert (await session.execute(text("SELECT count(*) FROM action_logs_default"))).scalar_one() == 0
+            assert (await session.execute(text("SELECT count(*) FROM action_logs"))).scalar_one() == 1
+            names = (
+                await session.execute(
+                    text("SELECT to_regclass('action_logs_pkey') IS NOT NULL, to_regclass('action_logs_pkey1')")
+                )
+            ).one()
+            assert names == (True, None)
+
+    run_with_sessions(scenario)
+
+
+def test_maintenance_skips_while_another_process_holds_the_lock(run_with_sessions):
+    async def scenario(session_factory):
+        month = _add_months(datetime.now(timezone.utc).date().replace(day=1), 5)
+        partition = f"action_logs_{month:%Y%m}"
+        async with session_factory() as session:
+            await session.execute(text(f'DROP TABLE IF EXISTS "{partition}"'))
+            await session.commit()
+
+        manager = ActionLogPartitionManager(months_ahead=5, retention_months=6, interval=3600)
+        manager._session_factory = session_factory
+        async with session_factory() as holder:
+            await holder.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _LOCK_ID})
+            await manager.run_once()
+            exists = await holder.execute(text("SELECT to_regclass(:name)"), {"name": partition})
+            assert exists.scalar_one() is None
+        await manager.run_once()
+
+        async with session_factory() as session:
+            exists = await session.execute(text("SELECT to_regclass(:name)"), {"name": partition})
+            assert exists.scalar_one() == partition
+
+    run_with_sessions(scenario)
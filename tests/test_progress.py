@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+import services.progress
+from services.outbound import OutboundSender
+from services.progress import ProgressTicker
+
+
+def _chat(chat_id, calls):
+    async def edit_text(text):
+        calls.append((chat_id, "edit", text))
+
+    async def send_chat_action(target, action):
+        calls.append((target, "action", action))
+
+    progress_message = SimpleNamespace(
+        chat=SimpleNamespace(id=chat_id),
+        edit_text=edit_text,
+        bot=SimpleNamespace(send_chat_action=send_chat_action),
+    )
+
+    async def answer(text):
+        calls.append((chat_id, "send", text))
+        return progress_message
+
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), answer=answer)
+
+
+def test_tick_edits_stalest_within_budget_and_signals_the_rest(monkeypatch):
+    sender = OutboundSender(global_rate=100, chat_rate=100, chat_burst=10, max_retries=1, concurrency=4)
+    monkeypatch.setattr(services.progress, "outbound", sender)
+    # One edit per tick; the background loop never wakes up during the test.
+    ticker = ProgressTicker(tick_seconds=100, step_seconds=5, edits_per_second=0.01)
+    calls = []
+
+    async def scenario():
+        try:
+            first = await ticker.start(_chat(1, calls), prefix="Генерирую", total_seconds=30)
+            second = await ticker.start(_chat(2, calls), prefix="Генерирую", total_seconds=30)
+            assert calls == [(1, "send", "Генерирую... ~30 сек осталось"), (2, "send", "Генерирую... ~30 сек осталось")]
+            calls.clear()
+
+            first.started_at -= 10
+            second.started_at -= 10
+            second.last_edit_at -= 1
+            await ticker._tick_once()
+            assert sorted(calls) == [(1, "action", "upload_photo"), (2, "edit", "Генерирую... ~20 сек осталось")]
+            calls.clear()
+
+            # Only the first message still shows stale text; the second did not change.
+            await ticker._tick_once()
+            assert calls == [(1, "edit", "Генерирую... ~20 сек осталось")]
+            assert ticker.stats() == {"active": 2, "edits": 2, "skipped": 1, "chat_actions": 1}
+
+            await ticker.finish(first, "Готово")
+            assert calls[-1] == (1, "edit", "Готово")
+            assert ticker.active_count == 1
+        finally:
+            await ticker.stop()
+            await sender.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import asyncio
+import dataclasses
+import os
+
+import services.result_buffer
+from config import settings
+from services.result_buffer import ResultBuffer
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_small_stream_stays_in_memory():
+    async def scenario():
+        return await ResultBuffer.from_stream(_chunks(b"ab", b"cd"), threshold=10)
+
+    buffer = asyncio.run(scenario())
+    with buffer:
+        assert not buffer.spilled
+        assert buffer.size == 4
+        assert buffer.as_input_file("a.png").file.read() == b"abcd"
+
+
+def test_large_stream_spills_to_disk_and_is_removed_on_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        services.result_buffer, "settings", dataclasses.replace(settings, result_spill_dir=str(tmp_path))
+    )
+
+    async def scenario():
+        return await ResultBuffer.from_stream(_chunks(b"x" * 6, b"y" * 6, b"z" * 6), threshold=10)
+
+    buffer = asyncio.run(scenario())
+    with buffer:
+        assert buffer.spilled
+        assert buffer.size == 18
+        path = buffer._path
+        assert os.path.dirname(path) == str(tmp_path)
+        # Every upload attempt reads the whole file from the start.
+        for _ in range(2):
+            assert buffer.as_input_file("a.mp4").file.read() == b"x" * 6 + b"y" * 6 + b"z" * 6
+    assert not os.path.exists(path)
+    assert list(tmp_path.iterdir()) == []
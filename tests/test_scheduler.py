@@ -0,0 +1,89 @@
+import asyncio
+from datetime import timedelta
+
+from sqlalchemy import func, select, update
+
+from db.models import Generation, User
+from db.repositories import debit_and_create_generation, update_generation_status
+from services.scheduler import GenerationJob, GenerationScheduler
+
+
+async def _debit(session_factory, user_id: int, cost: int) -> int:
+    async with session_factory() as session:
+        return await debit_and_create_generation(
+            session,
+            user_id,
+            cost_diamonds=cost,
+            cost_bananas=0,
+            method="nano",
+            payload=None,
+            kind="text2img",
+            model="nano",
+            prompt="cat",
+            preset=None,
+        )
+
+
+def test_stop_fails_and_refunds_running_and_pending_jobs(run_with_sessions, funded_user):
+    async def scenario(session_factory):
+        user_id = await funded_user(session_factory, 3001, diamonds=10)
+        running_id = await _debit(session_factory, user_id, 2)
+        pending_id = await _debit(session_factory, user_id, 3)
+        done_id = await _debit(session_factory, user_id, 4)
+        started = asyncio.Event()
+
+        async def hang(session):
+            started.set()
+            await asyncio.Event().wait()
+
+        async def complete(session):
+            await update_generation_status(session, done_id, "completed", result_url="file")
+
+        scheduler = GenerationScheduler(workers=1, queue_size=10, lane_limits={"nano": 1})
+        scheduler.start(session_factory)
+        for generation_id, cost, run in ((done_id, 4, complete), (running_id, 2, hang), (pending_id, 3, hang)):
+            scheduler.submit(
+                GenerationJob(
+                    lane="nano",
+                    tg_id=3001,
+                    run=run,
+                    generation_id=generation_id,
+                    user_id=user_id,
+                    refund_diamonds=cost,
+                )
+            )
+        await asyncio.wait_for(started.wait(), 5)
+        await scheduler.stop()
+
+        async with session_factory() as session:
+            user = (await session.execute(select(User).where(User.id == user_id))).scalar_one()
+            assert user.diamonds == 10 - 4
+            statuses = dict((await session.execute(select(Generation.id, Generation.status))).all())
+            assert statuses == {running_id: "failed", pending_id: "failed", done_id: "completed"}
+
+    run_with_sessions(scenario)
+
+
+def test_fail_stale_refunds_generations_left_processing(run_with_sessions, funded_user):
+    async def scenario(session_factory):
+        user_id = await funded_user(session_factory, 3002, diamonds=10)
+        stale_ids = [await _debit(session_factory, user_id, 2), await _debit(session_factory, user_id, 3)]
+        fresh_id = await _debit(session_factory, user_id, 4)
+        async with session_factory() as session:
+            await session.execute(
+                update(Generation)
+                .where(Generation.id.in_(stale_ids))
+                .values(created_at=func.now() - timedelta(hours=2))
+            )
+            await session.commit()
+
+        scheduler = GenerationScheduler(workers=1, queue_size=10, lane_limits={"nano": 1})
+        await scheduler.fail_stale(session_factory, max_age=3600)
+
+        async with session_factory() as session:
+            user = (await session.execute(select(User).where(User.id == user_id))).scalar_one()
+            assert user.diamonds == 10 - 4
+            statuses = dict((await session.execute(select(Generation.id, Generation.status))).all())
+            assert statuses == {stale_ids[0]: "failed", stale_ids[1]: "failed", fresh_id: "processing"}
+
+    run_with_sessions(scenario)
@@ -0,0 +1,26 @@
+import asyncio
+import dataclasses
+import re
+
+from sqlalchemy import text
+
+import db.session
+from config import settings
+
+
+def test_pgbouncer_mode_names_prepared_statements_uniquely(database_url, monkeypatch):
+    monkeypatch.setattr(db.session, "settings", dataclasses.replace(settings, db_pgbouncer=True))
+
+    async def scenario():
+        engine = db.session.create_engine(database_url)
+        try:
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+                result = await connection.execute(text("SELECT name FROM pg_prepared_statements"))
+                return result.scalars().all()
+        finally:
+            await engine.dispose()
+
+    names = asyncio.run(scenario())
+    assert names
+    assert all(re.fullmatch(r"__asyncpg_stmt_[0-9a-f]{32}__", name) for name in names)
@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.veo_poller import VeoOperationPoller
+
+
+class _Operations:
+    def __init__(self, polls_until_done, fail=False):
+        self._polls_until_done = polls_until_done
+        self._fail = fail
+        self.polled_at = []
+
+    async def get(self, operation):
+        self.polled_at.append(asyncio.get_running_loop().time())
+        if self._fail:
+            raise ConnectionError("boom")
+        return SimpleNamespace(name=operation.name, done=len(self.polled_at) >= self._polls_until_done)
+
+
+def _poller(operations, **kwargs):
+    client = SimpleNamespace(aio=SimpleNamespace(operations=operations))
+    return VeoOperationPoller(client, initial_delay=0.02, max_delay=0.08, backoff=2, batch_size=10, **kwargs)
+
+
+def test_poll_interval_backs_off_up_to_max_delay():
+    operations = _Operations(polls_until_done=5)
+    poller = _poller(operations)
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        try:
+            result = await poller.wait(SimpleNamespace(name="op", done=False))
+        finally:
+            await poller.stop()
+        return started, result
+
+    started, result = asyncio.run(scenario())
+    assert result.done
+    times = [started, *operations.polled_at]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    for gap, expected in zip(gaps, [0.02, 0.04, 0.08, 0.08, 0.08]):
+        assert expected - 0.005 <= gap < expected + 0.05
+    assert poller.pending_count == 0
+
+
+def test_repeated_poll_errors_fail_the_wait():
+    operations = _Operations(polls_until_done=100, fail=True)
+    poller = _poller(operations, max_errors=3)
+
+    async def scenario():
+        try:
+            with pytest.raises(RuntimeError, match="polling failed"):
+                await poller.wait(SimpleNamespace(name="op", done=False))
+        finally:
+            await poller.stop()
+
+    asyncio.run(scenario())
+    assert len(operations.polled_at) == 3
@@ -20,6 +20,16 @@ BTN_REFERRAL = "🧑‍🤝‍🧑 Реферальная программа"
 BTN_BACK = "⬅ Назад"
 BTN_RESET_PRESET = "❌ Сброс"
 BTN_BUY_TOKENS = "Купить токены"
+BTN_RESULT_CACHE_TEMPLATE = "♻️ Кэш результатов: {state}"
+BTN_HISTORY = "🖼 Мои генерации"
+BTN_HISTORY_NEWER = "⬅ Новее"
+BTN_HISTORY_OLDER = "Старее ➡"
+
+KIND_TITLES = {
+    "text2img": "Текст",
+    "preset_img2img": "Пресет",
+    "animate": "Видео",
+}
 
 PROFILE_MENU_BUTTONS = [
     BTN_ANIMATE,
@@ -0,0 +1,55 @@
+import json
+from typing import Dict, Optional
+
+from aiogram.dispatcher.storage import BaseStorage
+
+
+class RedisFSMStorage(BaseStorage):
+    """FSM storage on the shared ``redis.asyncio`` client.
+
+    aiogram 2.7 ships ``RedisStorage2`` for aioredis 1.x, which creates
+    ``asyncio.Lock(loop=...)`` and fails on Python 3.10+. Keys follow the
+    same ``fsm:<chat>:<user>:<part>`` layout.
+    """
+
+    def __init__(self, redis, prefix: str = "fsm") -> None:
+        self._redis = redis
+        self._prefix = prefix
+
+    def _key(self, chat, user, part: str) -> str:
+        chat, user = self.check_address(chat=chat, user=user)
+        return f"{self._prefix}:{chat}:{user}:{part}"
+
+    async def close(self) -> None:
+        # The client is shared with the other Redis users of the process.
+        return None
+
+    async def wait_closed(self) -> None:
+        return None
+
+    async def get_state(self, *, chat=None, user=None, default: Optional[str] = None) -> Optional[str]:
+        raw = await self._redis.get(self._key(chat, user, "state"))
+        return raw.decode() if raw is not None else default
+
+    async def set_state(self, *, chat=None, user=None, state: Optional[str] = None) -> None:
+        key = self._key(chat, user, "state")
+        if state is None:
+            await self._redis.delete(key)
+        else:
+            await self._redis.set(key, state)
+
+    async def get_data(self, *, chat=None, user=None, default: Optional[Dict] = None) -> Dict:
+        raw = await self._redis.get(self._key(chat, user, "data"))
+        return json.loads(raw) if raw is not None else dict(default or {})
+
+    async def set_data(self, *, chat=None, user=None, data: Optional[Dict] = None) -> None:
+        key = self._key(chat, user, "data")
+        if not data:
+            await self._redis.delete(key)
+        else:
+            await self._redis.set(key, json.dumps(data))
+
+    async def update_data(self, *, chat=None, user=None, data: Optional[Dict] = None, **kwargs) -> None:
+        current = await self.get_data(chat=chat, user=user)
+        current.update(data or {}, **kwargs)
+        await self.set_data(chat=chat, user=user, data=current)
@@ -8,6 +8,7 @@ class Preset:
     title: str
     prompt: str
     preview_url: str
+    max_side: Optional[int] = None
 
 
 _PRESETS: List[Preset] = [
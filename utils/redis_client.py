@@ -0,0 +1,25 @@
+import logging
+from typing import Optional
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_client = None
+
+
+def get_redis() -> Optional[object]:
+    """Shared ``redis.asyncio`` client, or ``None`` when Redis is not configured or installed."""
+    global _client
+    if _client is not None:
+        return _client
+    if not settings.redis_url:
+        return None
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:  # pragma: no cover - optional dependency
+        logger.warning("Redis requested but redis is not installed.")
+        return None
+    _client = aioredis.from_url(settings.redis_url)
+    return _client
@@ -2,12 +2,12 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
 from db.repositories import confirm_topup
-from db.session import create_engine, create_session_factory
+from db.session import create_engine, create_replica_engine, create_session_factory
 
 
 app = FastAPI()
 engine = create_engine()
-session_factory = create_session_factory(engine)
+session_factory = create_session_factory(engine, create_replica_engine())
 
 
 class PaymentWebhook(BaseModel):